@@ -0,0 +1,230 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+from music.models import Album, Performer, Track
+
+from .search import KINDS, LocalIndex, tokenize
+
+MAX_LIMIT = 50
+CACHE_MIN_RANGE = 1000
+
+
+def prefix_keys(label):
+    """Ключи для поиска по началу названия и по началу любого слова."""
+    tokens = tokenize(label)
+    return list(dict.fromkeys(
+        ' '.join(tokens[i:]) for i in range(len(tokens))
+    ))
+
+
+class AutocompleteIndex:
+    """Отсортированный массив нормализованных ключей для подсказок.
+
+    Поиск по префиксу — два бинарных поиска; для префиксов с большим
+    числом совпадений лучшие результаты кэшируются до их изменения.
+    Для треков в индексе хранится исполнитель: популярность трека входит
+    в популярность исполнителя.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = []
+        self.documents = {}
+        self.authors = {}
+        self._evictable = []
+        self._top = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls):
+        index = cls(getattr(settings, 'AUTOCOMPLETE_MAX_ENTRIES', 1000000))
+        rows = []
+        popularity = {
+            'performers': Performer.objects.annotate(
+                popularity=Coalesce(Sum('tracks__favorites_count'), 0)
+            ),
+            'tracks': Track.objects.annotate(popularity=F('favorites_count')),
+            'albums': Album.objects.annotate(popularity=F('favorites_count')),
+        }
+        for kind, queryset in popularity.items():
+            columns = ['id', KINDS[kind][1], 'popularity']
+            if kind == 'tracks':
+                columns.append('author_id')
+            for object_id, label, count, *author in queryset.values_list(
+                *columns
+            ).iterator(chunk_size=10000):
+                rows.append((count, kind, object_id, label, author))
+
+        rows.sort(key=lambda row: -row[0])
+        entries = []
+        for count, kind, object_id, label, author in rows:
+            keys = prefix_keys(label)
+            if len(entries) + len(keys) > index.max_entries:
+                break
+            index.documents[(kind, object_id)] = [label, count, keys]
+            if author:
+                index.authors[object_id] = author[0]
+            entries.extend((key, kind, object_id) for key in keys)
+            index._evictable.append((count, kind, object_id))
+        entries.sort()
+        index.entries = entries
+        heapq.heapify(index._evictable)
+        for first_char in {entry[0][:1] for entry in entries}:
+            index.complete(first_char)
+        return index
+
+    def _rank(self, document_key):
+        label, popularity, _ = self.documents[document_key]
+        return -popularity, len(label), document_key
+
+    def _cached_prefixes(self, keys):
+        if not self._top:
+            return []
+        prefixes = {
+            key[:length] for key in keys for length in range(1, len(key) + 1)
+        }
+        return [prefix for prefix in prefixes if prefix in self._top]
+
+    def _promote(self, document_key):
+        """Поднимает документ в закэшированных списках его префиксов."""
+        for prefix in self._cached_prefixes(self.documents[document_key][2]):
+            top = self._top[prefix]
+            if document_key not in top:
+                top.append(document_key)
+            top.sort(key=self._rank)
+            del top[MAX_LIMIT:]
+
+    def _demote(self, document_key, keys):
+        """Сбрасывает списки, где документ мог уступить место другому."""
+        for prefix in self._cached_prefixes(keys):
+            if document_key in self._top[prefix]:
+                del self._top[prefix]
+
+    def _remove_entries(self, kind, object_id):
+        document = self.documents.pop((kind, object_id), None)
+        if document is None:
+            return
+        if kind == 'tracks':
+            self.authors.pop(object_id, None)
+        for key in document[2]:
+            position = bisect_left(self.entries, (key, kind, object_id))
+            if (position < len(self.entries) and
+                    self.entries[position] == (key, kind, object_id)):
+                del self.entries[position]
+        self._demote((kind, object_id), document[2])
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries and self._evictable:
+            count, kind, object_id = heapq.heappop(self._evictable)
+            document = self.documents.get((kind, object_id))
+            if document is not None and document[1] == count:
+                self._remove_entries(kind, object_id)
+
+    def add(self, kind, object_id, label, popularity=None, author_id=None):
+        with self._lock:
+            document = self.documents.get((kind, object_id))
+            if popularity is None:
+                popularity = document[1] if document else 0
+            if author_id is None and kind == 'tracks':
+                author_id = self.authors.get(object_id)
+            self._remove_entries(kind, object_id)
+            keys = prefix_keys(label)
+            self.documents[(kind, object_id)] = [label, popularity, keys]
+            if author_id is not None:
+                self.authors[object_id] = author_id
+            for key in keys:
+                insort(self.entries, (key, kind, object_id))
+            heapq.heappush(self._evictable, (popularity, kind, object_id))
+            self._promote((kind, object_id))
+            self._evict()
+
+    def remove(self, kind, object_id):
+        with self._lock:
+            self._remove_entries(kind, object_id)
+
+    def change_popularity(self, kind, object_id, delta):
+        with self._lock:
+            document = self.documents.get((kind, object_id))
+            if document is None:
+                return
+            document[1] = max(document[1] + delta, 0)
+            heapq.heappush(self._evictable, (document[1], kind, object_id))
+            if delta > 0:
+                self._promote((kind, object_id))
+            else:
+                self._demote((kind, object_id), document[2])
+
+    def change_track_popularity(self, track_id, delta):
+        """Меняет популярность трека и его исполнителя."""
+        with self._lock:
+            self.change_popularity('tracks', track_id, delta)
+            author_id = self.authors.get(track_id)
+            if author_id is not None:
+                self.change_popularity('performers', author_id, delta)
+
+    def _collect(self, prefix):
+        low = bisect_left(self.entries, (prefix,))
+        high = bisect_left(self.entries, (prefix + '\uffff',))
+        document_keys = {
+            (kind, object_id)
+            for _, kind, object_id in self.entries[low:high]
+        }
+        return high - low, heapq.nsmallest(MAX_LIMIT, document_keys,
+                                           key=self._rank)
+
+    def complete(self, query, limit=10):
+        prefix = ' '.join(tokenize(query))
+        if not prefix:
+            return []
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None:
+                matched, top = self._collect(prefix)
+                if matched >= CACHE_MIN_RANGE:
+                    self._top[prefix] = top
+            results = []
+            for kind, object_id in top[:limit]:
+                label, popularity, _ = self.documents[(kind, object_id)]
+                results.append({
+                    'type': kind,
+                    'id': object_id,
+                    KINDS[kind][1]: label,
+                    'popularity': popularity,
+                })
+            return results
+
+
+autocomplete_index = LocalIndex(AutocompleteIndex.build,
+                                'AUTOCOMPLETE_INDEX_TTL')
+
+
+def update_suggestion(kind, object_id, label, author_id=None):
+    transaction.on_commit(lambda: autocomplete_index.apply(
+        lambda index: index.add(kind, object_id, label, author_id=author_id)
+    ))
+
+
+def remove_suggestion(kind, object_id):
+    transaction.on_commit(lambda: autocomplete_index.apply(
+        lambda index: index.remove(kind, object_id)
+    ))
+
+
+def change_track_popularity(favorite, delta):
+    track_id = favorite.track_id
+    transaction.on_commit(lambda: autocomplete_index.apply(
+        lambda index: index.change_track_popularity(track_id, delta)
+    ))
+
+
+def change_album_popularity(favorite, delta):
+    album_id = favorite.album_id
+    transaction.on_commit(lambda: autocomplete_index.apply(
+        lambda index: index.change_popularity('albums', album_id, delta)
+    ))
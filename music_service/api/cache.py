@@ -0,0 +1,283 @@
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from music.models import Album, Performer, Playlist, PlaylistTrack, Track
+from music_service.db.replicas import read_from_primary
+
+from .favorites import VERSION_KEY as FAVORITES_VERSION_KEY
+
+RESPONSE_KEY = 'response:{}:{}'
+LIST_VERSION_KEY = 'response-list:{}'
+OBJECT_VERSION_KEY = 'response-object:{}:{}'
+LOCK_POLL_INTERVAL = 0.05
+
+PLAYLIST_TRACKS = 'playlist-tracks'
+FAVORITE_FIELDS = ('is_favorite', 'is_favorited')
+VERSIONED_MODELS = {
+    'performers': Performer,
+    'albums': Album,
+    'tracks': Track,
+    'playlists': Playlist,
+}
+
+_batch = threading.local()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_versions(keys):
+    """Текущие версии; отсутствующие создаются, чтобы не ожить старым."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _merge_ranges(ranges):
+    """Один диапазон номеров треков на плейлист, None — без границы."""
+    bounds = {}
+    for playlist_id, low, high in ranges:
+        if playlist_id in bounds:
+            other_low, other_high = bounds[playlist_id]
+            low = None if None in (low, other_low) else min(low, other_low)
+            high = (None if None in (high, other_high)
+                    else max(high, other_high))
+        bounds[playlist_id] = low, high
+    return bounds
+
+
+def _track_number_condition(bounds):
+    condition = Q()
+    for playlist_id, (low, high) in bounds.items():
+        rows = Q(playlist_id=playlist_id)
+        if low is not None:
+            rows &= Q(track_number__gte=low)
+        if high is not None:
+            rows &= Q(track_number__lte=high)
+        condition |= rows
+    return condition
+
+
+def _apply(changes):
+    objects = defaultdict(set)
+    for namespace, pk in changes:
+        objects[namespace].add(pk)
+    ranges = objects.pop(PLAYLIST_TRACKS, None)
+    if ranges:
+        bounds = _merge_ranges(ranges)
+        objects['playlists'].update(bounds)
+        objects['tracks'].update(PlaylistTrack.objects.filter(
+            _track_number_condition(bounds)
+        ).values_list('track_id', flat=True))
+
+    updated_at = timezone.now()
+    for namespace, pks in objects.items():
+        VERSIONED_MODELS[namespace].objects.filter(pk__in=pks).update(
+            version=F('version') + 1, updated_at=updated_at
+        )
+
+    keys = [LIST_VERSION_KEY.format(namespace) for namespace in objects]
+    keys += [OBJECT_VERSION_KEY.format(namespace, pk)
+             for namespace, pks in objects.items() for pk in pks]
+    transaction.on_commit(
+        lambda: cache.set_many({key: uuid4().hex for key in keys}, None)
+    )
+
+
+def invalidate_responses(namespace, pks):
+    """Помечает объекты pks изменёнными и сбрасывает списки namespace.
+
+    Версия объектов в базе растёт в той же транзакции, а версии ответов
+    в кэше меняются после коммита, чтобы параллельный запрос не успел
+    закэшировать ещё не закоммиченное состояние под новой версией.
+    """
+    changes = {(namespace, pk) for pk in pks}
+    if not changes:
+        return
+    batch = getattr(_batch, 'changes', None)
+    if batch is not None:
+        batch.update(changes)
+        return
+    _apply(changes)
+
+
+def invalidate_playlist_responses(playlist_ids, low=None, high=None):
+    """Помечает изменёнными плейлисты и их треки с номерами от low до high.
+
+    В ответах треков есть их позиции в плейлистах, поэтому помечать нужно
+    только треки, чьи позиции сдвинулись. Без границ помечаются все треки
+    плейлистов: например, когда плейлист переименован.
+    """
+    invalidate_responses(PLAYLIST_TRACKS, [
+        (playlist_id, low, high) for playlist_id in playlist_ids
+    ])
+
+
+@contextmanager
+def batch_invalidation():
+    """Копит изменения и применяет их разом при выходе из блока.
+
+    Вызывать внутри транзакции, чтобы версии обновились вместе с данными.
+    """
+    if getattr(_batch, 'changes', None) is not None:
+        yield
+        return
+    _batch.changes = set()
+    try:
+        yield
+        changes = _batch.changes
+    finally:
+        _batch.changes = None
+    if changes:
+        _apply(changes)
+
+
+class CachedResponseMixin:
+    """Кэширует ответы list и retrieve.
+
+    Ключ строится из адреса запроса и версии списка или объекта, а для
+    ответов с полями избранного — ещё и из пользователя и версии его
+    избранного; остальные ответы общие для всех пользователей.
+    Запись меняет версии, и старые ответы просто перестают читаться.
+    Пока один запрос собирает ответ, остальные с тем же ключом ждут его,
+    а не идут в базу. Ответ для кэша читается из основной базы, а не из
+    реплики, которая могла ещё не получить изменения новой версии.
+    """
+    cache_namespace = None
+    cache_per_user = True
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            [LIST_VERSION_KEY.format(self.cache_namespace)],
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            pk = int(lookup)
+        except (TypeError, ValueError):
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_cached_response(
+            [OBJECT_VERSION_KEY.format(self.cache_namespace, pk)],
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_response_cache_key(self, request, version_keys):
+        version_keys = list(version_keys)
+        user = 'shared'
+        if user_fields_selected(self, request):
+            user = request.user.pk
+            version_keys.append(FAVORITES_VERSION_KEY.format(user))
+        digest = hashlib.md5('\n'.join(map(str, [
+            request.build_absolute_uri(), user, *get_versions(version_keys)
+        ])).encode()).hexdigest()
+        return RESPONSE_KEY.format(self.cache_namespace, digest)
+
+    def get_cached_response(self, version_keys, handler, request, *args,
+                            **kwargs):
+        key = self.get_response_cache_key(request, version_keys)
+        lock_key = f'{key}:lock'
+        lock_timeout = _setting('RESPONSE_CACHE_LOCK_TIMEOUT', 10)
+        deadline = time.monotonic() + lock_timeout
+        while True:
+            cached = cache.get(key)
+            if cached is not None:
+                return Response(cached[1], status=cached[0],
+                                headers={'X-Cache': 'HIT'})
+            if cache.add(lock_key, 1, lock_timeout):
+                break
+            if time.monotonic() >= deadline:
+                return handler(request, *args, **kwargs)
+            time.sleep(LOCK_POLL_INTERVAL)
+
+        try:
+            with read_from_primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, (response.status_code, response.data),
+                          _setting('RESPONSE_CACHE_TIMEOUT', 300))
+            response['X-Cache'] = 'MISS'
+            return response
+        finally:
+            cache.delete(lock_key)
+
+
+def user_fields_selected(view, request):
+    """Попадут ли в ответ флаги избранного текущего пользователя."""
+    if not (view.cache_per_user and request.user.is_authenticated):
+        return False
+    fields = view.get_serializer_class().Meta.fields
+    return any(name in fields and view.wants_field(name)
+               for name in FAVORITE_FIELDS)
+
+
+def selection_digest(selection):
+    """Отпечаток ?fields= и ?expand=, не зависящий от порядка имён."""
+    fields = selection['fields']
+    normalized = '\n'.join([
+        '*' if fields is None else ','.join(sorted(set(fields))),
+        ','.join(sorted(set(selection['expand']))),
+    ])
+    return hashlib.md5(normalized.encode()).hexdigest()[:12]
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на retrieve, если версия объекта не изменилась.
+
+    ETag и Last-Modified берутся из колонок version и updated_at одним
+    запросом до сериализации. ETag учитывает набор полей из ?fields= и
+    ?expand=. Если в ответе есть поля избранного, ETag учитывает ещё и
+    версию избранного пользователя, а Last-Modified не отдаётся: по
+    времени изменения объекта его не проверить.
+    """
+    cache_per_user = True
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        model = self.get_queryset().model
+        stamp = model.objects.filter(pk=lookup).values_list(
+            'version', 'updated_at'
+        ).first() if str(lookup).isdigit() else None
+        if stamp is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        version, updated_at = stamp
+        parts = [lookup, version, request.accepted_renderer.format]
+        selection = self.get_field_selection()
+        if selection is not None:
+            parts.append(selection_digest(selection))
+        last_modified = int(updated_at.timestamp())
+        if user_fields_selected(self, request):
+            parts += get_versions(
+                [FAVORITES_VERSION_KEY.format(request.user.pk)]
+            )
+            last_modified = None
+        etag = quote_etag('-'.join(map(str, parts)))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
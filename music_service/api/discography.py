@@ -0,0 +1,118 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from music.models import Album, AlbumTrack, Track
+from music_service.db.replicas import read_from_primary
+
+from .cache import invalidate_responses
+
+SINGLE = 'Single'
+CACHE_KEY = 'discography:{}'
+
+_batch = threading.local()
+
+
+def _cache_timeout():
+    return getattr(settings, 'DISCOGRAPHY_CACHE_TIMEOUT', 60 * 60)
+
+
+def build_discographies(performer_ids):
+    """Собирает треки и альбомы исполнителей тремя запросами."""
+    discographies = {
+        performer_id: {'tracks': [], 'albums': []}
+        for performer_id in performer_ids
+    }
+    first_albums = {}
+    album_tracks = AlbumTrack.objects.filter(
+        track__author__in=discographies
+    ).order_by('track_id', 'album_id').values_list(
+        'track_id', 'album_id', 'album__title'
+    )
+    for track_id, album_id, album_title in album_tracks:
+        first_albums.setdefault(track_id, {'id': album_id,
+                                           'title': album_title})
+
+    tracks = Track.objects.filter(
+        author__in=discographies
+    ).order_by('id').values_list('id', 'title', 'author_id')
+    for track_id, title, author_id in tracks:
+        discographies[author_id]['tracks'].append({
+            'id': track_id,
+            'title': title,
+            'album': first_albums.get(track_id, SINGLE),
+        })
+
+    albums = Album.objects.filter(
+        author__in=discographies
+    ).order_by('id').values_list('id', 'title', 'author_id')
+    for album_id, title, author_id in albums:
+        discographies[author_id]['albums'].append({'id': album_id,
+                                                   'title': title})
+    return discographies
+
+
+def get_discographies(performer_ids):
+    keys = {
+        performer_id: CACHE_KEY.format(performer_id)
+        for performer_id in performer_ids
+    }
+    cached = cache.get_many(keys.values())
+    discographies = {
+        performer_id: cached[key]
+        for performer_id, key in keys.items() if key in cached
+    }
+    missing = [
+        performer_id for performer_id in keys
+        if performer_id not in discographies
+    ]
+    if missing:
+        with read_from_primary():
+            built = build_discographies(missing)
+        cache.set_many(
+            {keys[performer_id]: data for performer_id, data in built.items()},
+            _cache_timeout()
+        )
+        discographies.update(built)
+    return discographies
+
+
+def invalidate_discographies(performer_ids):
+    """Сбрасывает дискографии исполнителей после коммита транзакции.
+
+    Удалённая до коммита запись успела бы снова собраться параллельным
+    запросом из ещё не закоммиченных данных и прожить час.
+    """
+    performer_ids = set(performer_ids)
+    keys = [CACHE_KEY.format(performer_id) for performer_id in performer_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    invalidate_responses('performers', performer_ids)
+
+
+def invalidate_track_discographies(track_ids):
+    pending = getattr(_batch, 'track_ids', None)
+    if pending is not None:
+        pending.update(track_ids)
+        return
+    invalidate_discographies(Track.objects.filter(
+        pk__in=track_ids
+    ).values_list('author_id', flat=True))
+
+
+@contextmanager
+def deferred_invalidation():
+    """Копит треки из сигналов и сбрасывает кэш одним запросом."""
+    if getattr(_batch, 'track_ids', None) is not None:
+        yield
+        return
+    _batch.track_ids = set()
+    try:
+        yield
+    finally:
+        track_ids = _batch.track_ids
+        _batch.track_ids = None
+        if track_ids:
+            invalidate_track_discographies(track_ids)
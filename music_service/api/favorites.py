@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from music.models import FavoriteAlbum, FavoritePlaylist, FavoriteTrack
+from music_service.db.replicas import read_from_primary
+
+VERSION_KEY = 'favorites-version:{}'
+
+Favorites = namedtuple('Favorites', ('tracks', 'albums', 'playlists'))
+
+
+def load_favorites(user_id):
+    return Favorites(
+        tracks=set(FavoriteTrack.objects.filter(
+            user_id=user_id
+        ).values_list('track_id', flat=True)),
+        albums=set(FavoriteAlbum.objects.filter(
+            user_id=user_id
+        ).values_list('album_id', flat=True)),
+        playlists=set(FavoritePlaylist.objects.filter(
+            user_id=user_id
+        ).values_list('playlist_id', flat=True)),
+    )
+
+
+class FavoritesCache:
+    """LRU-кэш избранного пользователей с ограничением по размеру и времени.
+
+    Записи сверяются с версией в кэше Django. Если он общий для процессов
+    (например, файловый), изменения из других процессов видны сразу, а с
+    кэшем в памяти процесса — не позже чем через timeout секунд.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        version = cache.get(VERSION_KEY.format(user_id))
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if (entry is not None and entry[0] == version
+                    and time.monotonic() - entry[2] < self.timeout):
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        loaded_at = time.monotonic()
+        with read_from_primary():
+            favorites = load_favorites(user_id)
+        with self._lock:
+            self._entries[user_id] = (version, favorites, loaded_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return favorites
+
+    def update(self, user_id, kind, object_id, added):
+        """Учитывает изменение избранного после коммита транзакции.
+
+        Новая версия до коммита позволила бы параллельному запросу
+        загрузить под ней ещё старое избранное.
+        """
+        transaction.on_commit(
+            lambda: self._apply(user_id, kind, object_id, added)
+        )
+
+    def _apply(self, user_id, kind, object_id, added):
+        key = VERSION_KEY.format(user_id)
+        previous = cache.get(key)
+        version = uuid4().hex
+        cache.set(key, version, None)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if entry[0] != previous:
+                del self._entries[user_id]
+                return
+            ids = getattr(entry[1], kind)
+            if added:
+                ids.add(object_id)
+            else:
+                ids.discard(object_id)
+            self._entries[user_id] = (version, entry[1], entry[2])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+favorites_cache = FavoritesCache(
+    getattr(settings, 'FAVORITES_CACHE_SIZE', 1024),
+    getattr(settings, 'FAVORITES_CACHE_TIMEOUT', 60),
+)
+
+
+def get_request_favorites(context):
+    """Избранное пользователя из запроса, загружается один раз на запрос."""
+    if 'favorites' not in context:
+        request = context.get('request')
+        user = getattr(request, 'user', None)
+        context['favorites'] = (
+            favorites_cache.get(user.pk)
+            if user is not None and user.is_authenticated else None
+        )
+    return context['favorites']
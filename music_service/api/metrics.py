@@ -0,0 +1,298 @@
+import atexit
+import ipaddress
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from hmac import compare_digest
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from music_service.db.pool import pool_stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Метрика: тип, описание и имена меток.
+METRICS = {
+    'api_requests_total': (
+        'counter', 'Запросы к API',
+        ('view', 'action', 'method', 'status'),
+    ),
+    'api_request_duration_seconds': (
+        'histogram', 'Время ответа на запрос', ('view', 'action', 'method'),
+    ),
+    'api_db_queries_total': (
+        'counter', 'Запросы к базе при ответах', ('view', 'action'),
+    ),
+    'api_db_duration_seconds_total': (
+        'counter', 'Время запросов к базе при ответах', ('view', 'action'),
+    ),
+    'api_cache_requests_total': (
+        'counter', 'Обращения к кэшу ответов', ('view', 'result'),
+    ),
+    'db_pool_connections': (
+        'gauge', 'Соединения в пулах: открытые и свободные',
+        ('alias', 'state'),
+    ),
+    'db_pool_checkouts_total': (
+        'counter', 'Выдачи соединений из пула', ('alias',),
+    ),
+    'db_pool_connects_total': (
+        'counter', 'Новые соединения, открытые пулом', ('alias',),
+    ),
+    'db_pool_waits_total': (
+        'counter', 'Ожидания свободного соединения', ('alias',),
+    ),
+    'db_pool_timeouts_total': (
+        'counter', 'Ожидания, не дождавшиеся соединения', ('alias',),
+    ),
+    'db_pool_discarded_total': (
+        'counter', 'Соединения, закрытые пулом как негодные', ('alias',),
+    ),
+}
+
+
+class Registry:
+    """Значения метрик процесса.
+
+    С каталогом directory метрики общие для всех процессов: каждый не чаще
+    раза в flush_interval секунд сбрасывает свои значения в файл
+    <pid>.json, а collect() складывает файлы всех процессов: счётчики —
+    в том числе уже завершившихся, чтобы не уменьшались, а показатели
+    (gauge) — только живых. collectors перед сбросом и выдачей записывают
+    в реестр значения, которые удобнее снимать, чем считать по ходу.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0, collectors=()):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.collectors = collectors
+        self.lock = threading.Lock()
+        self.reset()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.values = {}
+        self.flushed = time.monotonic()
+
+    def _series(self, name, labels, default):
+        # Процесс, порождённый fork, не должен повторять значения родителя.
+        if self.pid != os.getpid():
+            self.reset()
+        key = (name, labels)
+        if key not in self.values:
+            self.values[key] = default()
+        return key
+
+    def inc(self, name, labels, amount=1):
+        with self.lock:
+            key = self._series(name, labels, int)
+            self.values[key] += amount
+
+    def set(self, name, labels, value):
+        with self.lock:
+            key = self._series(name, labels, int)
+            self.values[key] = value
+
+    def observe(self, name, labels, value):
+        """Добавляет значение в гистограмму: число по корзинам и сумма."""
+        with self.lock:
+            key = self._series(
+                name, labels, lambda: [0] * (len(LATENCY_BUCKETS) + 2)
+            )
+            data = self.values[key]
+            data[bisect_left(LATENCY_BUCKETS, value)] += 1
+            data[-1] += value
+
+    def maybe_flush(self):
+        if self.directory and (
+            time.monotonic() - self.flushed >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        for collector in self.collectors:
+            collector(self)
+        with self.lock:
+            if self.pid != os.getpid():
+                return
+            rows = [[name, list(labels), value]
+                    for (name, labels), value in self.values.items()]
+            path = os.path.join(self.directory, f'{self.pid}.json')
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(rows, file)
+            os.replace(f'{path}.tmp', path)
+            self.flushed = time.monotonic()
+
+    def collect(self):
+        """Значения всех процессов, сложенные по метрикам и меткам."""
+        if not self.directory:
+            for collector in self.collectors:
+                collector(self)
+            with self.lock:
+                return {key: value.copy() if isinstance(value, list)
+                        else value for key, value in self.values.items()}
+        self.flush()
+        merged = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as file:
+                    rows = json.load(file)
+            except (OSError, ValueError):
+                continue
+            alive = is_alive(int(entry.name[:-len('.json')]))
+            for name, labels, value in rows:
+                if not alive and METRICS[name][0] == 'gauge':
+                    continue
+                key = (name, tuple(labels))
+                if key not in merged:
+                    merged[key] = value
+                elif isinstance(value, list):
+                    merged[key] = [a + b for a, b in zip(merged[key], value)]
+                else:
+                    merged[key] += value
+        return merged
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect_pool_stats(registry):
+    for alias, stats in pool_stats().items():
+        registry.set('db_pool_connections', (alias, 'open'), stats['open'])
+        registry.set('db_pool_connections', (alias, 'idle'), stats['idle'])
+        for name in ('checkouts', 'connects', 'waits', 'timeouts',
+                     'discarded'):
+            registry.set(f'db_pool_{name}_total', (alias,), stats[name])
+
+
+def format_labels(names, values):
+    pairs = []
+    for name, value in zip(names, values):
+        value = (str(value).replace('\\', r'\\').replace('"', r'\"')
+                 .replace('\n', r'\n'))
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def render(values):
+    """Текстовый формат Prometheus."""
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        series = sorted((labels, value)
+                        for (metric, labels), value in values.items()
+                        if metric == name)
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(
+                    f'{name}{format_labels(label_names, labels)} {value}'
+                )
+                continue
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), value):
+                cumulative += count
+                bucket_labels = format_labels(
+                    (*label_names, 'le'), (*labels, bound)
+                )
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            series_labels = format_labels(label_names, labels)
+            lines.append(f'{name}_sum{series_labels} {value[-1]}')
+            lines.append(f'{name}_count{series_labels} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry(
+    getattr(settings, 'METRICS_DIR', None),
+    getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0),
+    collectors=(collect_pool_stats,),
+)
+
+
+def describe(request):
+    """Метки запроса: basename и действие viewset'а или имя маршрута."""
+    method = request.method.lower()
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched', method
+    view = match.func
+    basename = getattr(view, 'initkwargs', {}).get('basename')
+    actions = getattr(view, 'actions', None)
+    if basename and actions:
+        return basename, actions.get(method, method)
+    return match.url_name or match.view_name, method
+
+
+class MetricsMiddleware:
+    """Собирает число и время ответов, запросов к базе и попаданий в кэш.
+
+    Ставится выше QueryCountMiddleware: число запросов к базе берётся из
+    подсчёта, который тот уже ведёт, а попадания в кэш — из X-Cache.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view, action = describe(request)
+        registry.inc('api_requests_total', (
+            view, action, request.method, str(response.status_code)
+        ))
+        registry.observe('api_request_duration_seconds',
+                         (view, action, request.method), duration)
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            registry.inc('api_db_queries_total', (view, action), stats.count)
+            registry.inc('api_db_duration_seconds_total', (view, action),
+                         stats.duration)
+        cache_result = response.get('X-Cache')
+        if cache_result:
+            registry.inc('api_cache_requests_total',
+                         (view, cache_result.lower()))
+        registry.maybe_flush()
+        return response
+
+
+def is_allowed(request):
+    """Пускает по токену METRICS_TOKEN или адресу из METRICS_ALLOWED_IPS."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(),
+        f'Bearer {token}'.encode()
+    ):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network.strip(), strict=False)
+        for network in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    )
+
+
+def metrics_view(request):
+    if not is_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(registry.collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,140 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.queries')
+
+PLACEHOLDERS_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+NUMBERS_RE = re.compile(r'\b\d+\b')
+DEFAULT_BUDGET = {'queries': None, 'duplicates': None}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    """SQL без значений: запросы, различающиеся только ими, совпадают."""
+    return NUMBERS_RE.sub('0', PLACEHOLDERS_RE.sub('(...)', sql))
+
+
+def get_budget(route):
+    """Бюджет маршрута из QUERY_BUDGETS поверх бюджета по умолчанию."""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return {**DEFAULT_BUDGET, **budgets.get('default', {}),
+            **budgets.get(route, {})}
+
+
+class QueryStats:
+    """Число запросов к базе, их общее время и повторы одинаковых."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    @contextmanager
+    def collect(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def duplicates(self):
+        """Сколько раз выполнен самый частый запрос и его форма."""
+        if not self.shapes:
+            return 0, None
+        shape, count = self.shapes.most_common(1)[0]
+        return count, shape
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'duplicates': self.duplicates[0],
+        }
+
+    def violations(self, budget):
+        """Чем статистика выходит за бюджет; пустой список, если ничем."""
+        problems = []
+        if budget['queries'] is not None and self.count > budget['queries']:
+            problems.append(
+                f'запросов к базе {self.count} при бюджете {budget["queries"]}'
+            )
+        repeats, shape = self.duplicates
+        if budget['duplicates'] is not None and repeats > budget['duplicates']:
+            problems.append(f'один запрос выполнен {repeats} раз: {shape}')
+        return problems
+
+
+class QueryCountMiddleware:
+    """Считает запросы к базе на каждый запрос и сверяет их с бюджетом.
+
+    Итог пишется в лог api.queries строкой JSON уровня INFO, а при
+    QUERY_COUNT_HEADERS (по умолчанию в режиме отладки) — ещё и в заголовки
+    X-DB-*. Выход за бюджет маршрута из QUERY_BUDGETS — предупреждение в
+    логе, а при QUERY_BUDGET_STRICT — исключение, на котором падают тесты.
+    Для потоковых ответов итог подводится, когда поток отдан целиком.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = request.query_stats = QueryStats()
+        with stats.collect():
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, stats, request, response
+            )
+            return response
+        if getattr(settings, 'QUERY_COUNT_HEADERS', settings.DEBUG):
+            response['X-DB-Queries'] = stats.count
+            response['X-DB-Time-Ms'] = stats.as_dict()['db_ms']
+            response['X-DB-Duplicates'] = stats.duplicates[0]
+        self.report(stats, request, response)
+        return response
+
+    def stream(self, content, stats, request, response):
+        with stats.collect():
+            yield from content
+        self.report(stats, request, response)
+
+    def report(self, stats, request, response):
+        match = request.resolver_match
+        route = match.view_name if match else None
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            **stats.as_dict(),
+        }
+        problems = stats.violations(get_budget(route))
+        if not problems:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(json.dumps(record, ensure_ascii=False))
+            return
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path}: {"; ".join(problems)}'
+            )
+        record['budget_exceeded'] = problems
+        logger.warning(json.dumps(record, ensure_ascii=False))
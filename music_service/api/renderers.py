@@ -0,0 +1,66 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+
+def _escape(ret):
+    """Экранирует U+2028 и U+2029, как JSONRenderer в DRF.
+
+    Эти символы допустимы в JSON, но ломают вставку ответа в JavaScript.
+    """
+    return ret.replace('\u2028'.encode(), b'\\u2028').replace(
+        '\u2029'.encode(), b'\\u2029'
+    )
+
+
+def dumps(data):
+    """JSON в байтах: через orjson, если он установлен."""
+    if orjson is not None:
+        ret = orjson.dumps(
+            data, default=_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME
+        )
+    else:
+        ret = json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode()
+    return _escape(ret)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson; типы вне JSON кодируются как в DRF."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+        return _escape(
+            orjson.dumps(data, default=_encoder.default, option=option)
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default,
+                             use_bin_type=True, datetime=False)
@@ -0,0 +1,280 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from music.models import Album, Performer, Track
+
+logger = logging.getLogger(__name__)
+
+KINDS = {
+    'performers': (Performer, 'name'),
+    'tracks': (Track, 'title'),
+    'albums': (Album, 'title'),
+}
+
+TOKEN_RE = re.compile(r'\w+')
+
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+MIN_SIMILARITY = 0.3
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.casefold().replace('ё', 'е'))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(token):
+    if len(token) <= 3:
+        return 0
+    if len(token) <= 7:
+        return 1
+    return 2
+
+
+def edit_distance(first, second, limit):
+    """Расстояние Левенштейна; если оно больше limit, возвращает limit + 1."""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_char != second_char),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class SearchIndex:
+    """Инвертированный индекс названий исполнителей, треков и альбомов.
+
+    Слова документов ведут к документам, триграммы слов — к словам
+    словаря, по ним подбираются варианты с опечатками.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.postings = defaultdict(set)
+        self.trigrams = defaultdict(set)
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        for kind, (model, field) in KINDS.items():
+            rows = model.objects.values_list('id', field).iterator(
+                chunk_size=10000
+            )
+            for object_id, label in rows:
+                index.add(kind, object_id, label)
+        return index
+
+    def add(self, kind, object_id, label):
+        key = (kind, object_id)
+        tokens = tuple(dict.fromkeys(tokenize(label)))
+        with self._lock:
+            self.remove(kind, object_id)
+            self.documents[key] = (label, tokens)
+            for token in tokens:
+                if not self.postings[token]:
+                    for trigram in trigrams(token):
+                        self.trigrams[trigram].add(token)
+                self.postings[token].add(key)
+
+    def remove(self, kind, object_id):
+        key = (kind, object_id)
+        with self._lock:
+            document = self.documents.pop(key, None)
+            if document is None:
+                return
+            for token in document[1]:
+                keys = self.postings[token]
+                keys.discard(key)
+                if not keys:
+                    del self.postings[token]
+                    for trigram in trigrams(token):
+                        self.trigrams[trigram].discard(token)
+                        if not self.trigrams[trigram]:
+                            del self.trigrams[trigram]
+
+    def match_token(self, query_token):
+        """Слова словаря, подходящие под слово запроса, с их весами."""
+        matches = {}
+        if query_token in self.postings:
+            matches[query_token] = EXACT_WEIGHT
+        query_trigrams = trigrams(query_token)
+        # Триграмма из первой буквы есть у огромной доли словаря: для
+        # длинных слов её пропускаем и учитываем совпадение отдельно.
+        leading = f'  {query_token[0]}'
+        scanned = query_trigrams
+        if len(query_token) >= 3:
+            scanned = query_trigrams - {leading}
+        overlaps = defaultdict(int)
+        for trigram in scanned:
+            for token in self.trigrams.get(trigram, ()):
+                overlaps[token] += 1
+        if scanned is not query_trigrams:
+            for token in overlaps:
+                overlaps[token] += token[0] == query_token[0]
+        limit = max_typos(query_token)
+        for token, overlap in overlaps.items():
+            if token in matches:
+                continue
+            if token.startswith(query_token):
+                matches[token] = PREFIX_WEIGHT * len(query_token) / len(token)
+                continue
+            similarity = overlap / (
+                len(query_trigrams) + len(trigrams(token)) - overlap
+            )
+            if similarity < MIN_SIMILARITY:
+                continue
+            distance = edit_distance(query_token, token, limit)
+            if distance <= limit:
+                matches[token] = FUZZY_WEIGHT * (
+                    1 - distance / max(len(query_token), len(token))
+                )
+        return matches
+
+    def search(self, query, limit=10):
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        results = {kind: [] for kind in KINDS}
+        if not query_tokens:
+            return results
+
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        with self._lock:
+            for query_token in query_tokens:
+                best = {}
+                for token, weight in self.match_token(query_token).items():
+                    for key in self.postings[token]:
+                        if weight > best.get(key, 0):
+                            best[key] = weight
+                for key, weight in best.items():
+                    scores[key] += weight
+                    matched[key] += 1
+
+            ranked = sorted(
+                scores,
+                key=lambda key: (
+                    -matched[key],
+                    -scores[key] / len(self.documents[key][1]),
+                    key[1],
+                )
+            )
+            for key in ranked:
+                kind, object_id = key
+                if len(results[kind]) >= limit:
+                    continue
+                label = self.documents[key][0]
+                results[kind].append({
+                    'id': object_id,
+                    KINDS[kind][1]: label,
+                    'score': round(scores[key] / len(query_tokens), 3),
+                })
+        return results
+
+
+class LocalIndex:
+    """Индекс, который строится в каждом процессе.
+
+    Впервые индекс строится при первом обращении, а дальше раз в ttl
+    секунд перестраивается в фоновом потоке, чтобы подхватить изменения
+    других воркеров: пока новый индекс строится, запросы пользуются
+    старым. Свои изменения процесс вносит после фиксации транзакции, а
+    внесённые во время перестройки повторяет на новом индексе.
+    """
+
+    def __init__(self, build, ttl_setting, default_ttl=300):
+        self._build = build
+        self._ttl_setting = ttl_setting
+        self._default_ttl = default_ttl
+        self._index = None
+        self._built_at = None
+        # Изменения, внесённые во время перестройки; None — её нет.
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        ttl = getattr(settings, self._ttl_setting, self._default_ttl)
+        with self._lock:
+            if self._index is None:
+                self._index = self._build()
+                self._built_at = time.monotonic()
+            elif (self._pending is None and
+                    time.monotonic() - self._built_at > ttl):
+                self._pending = []
+                threading.Thread(
+                    target=self._rebuild, args=(self._pending,), daemon=True
+                ).start()
+            return self._index
+
+    def _rebuild(self, pending):
+        try:
+            index = self._build()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс')
+            index = None
+        finally:
+            connections.close_all()
+        with self._lock:
+            # После reset() перестройка могла начаться заново.
+            if self._pending is not pending:
+                return
+            if index is not None:
+                for operation in pending:
+                    operation(index)
+                self._index = index
+            self._built_at = time.monotonic()
+            self._pending = None
+
+    def apply(self, operation):
+        """Вносит изменение operation(index) в построенные индексы."""
+        with self._lock:
+            index = self._index
+            if self._pending is not None:
+                self._pending.append(operation)
+        if index is not None:
+            operation(index)
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+            self._pending = None
+
+
+search_index = LocalIndex(SearchIndex.build, 'SEARCH_INDEX_TTL')
+
+
+def update_document(kind, object_id, label):
+    transaction.on_commit(lambda: search_index.apply(
+        lambda index: index.add(kind, object_id, label)
+    ))
+
+
+def remove_document(kind, object_id):
+    transaction.on_commit(lambda: search_index.apply(
+        lambda index: index.remove(kind, object_id)
+    ))
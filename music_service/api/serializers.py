@@ -1,10 +1,116 @@
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
 
-from music.models import (Album, AlbumTrack, FavoriteAlbum, FavoritePlaylist,
-                          FavoriteTrack, Performer, Playlist, PlaylistTrack,
-                          Track)
+from music.exporter import RENDERERS
+from music.models import (Album, AlbumTrack, Performer, Playlist,
+                          PlaylistTrack, Track)
 from users.models import User
 
+from .autocomplete import MAX_LIMIT
+from .cache import invalidate_playlist_responses
+from .discography import get_discographies
+from .favorites import get_request_favorites
+
+SKIP = object()
+
+
+class SparseFieldsMixin:
+    """Оставляет в ответе только запрошенные поля.
+
+    Без fields и expand сериализатор отдаёт все поля. Если передан хотя
+    бы один из них, остаются поля из fields (по умолчанию все, кроме
+    expandable_fields) и раскрытия из expand. Неотданные поля ничего не
+    вычисляют.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            return
+        unknown = set(fields or ()) | set(expand or ())
+        unknown -= set(self.fields)
+        if unknown:
+            names = ', '.join(sorted(unknown))
+            raise serializers.ValidationError(
+                {'fields': [f'Неизвестные поля: {names}']}
+            )
+        allowed = set(self.basic_field_names(fields)) | set(expand or ())
+        for name in list(self.fields):
+            if name not in allowed:
+                self.fields.pop(name)
+
+    def basic_field_names(self, fields=None):
+        if fields is not None:
+            return fields
+        return [name for name in self.fields
+                if name not in self.expandable_fields]
+
+
+SIMPLE_FIELDS = (serializers.CharField, serializers.IntegerField,
+                 serializers.ReadOnlyField)
+
+
+def field_reader(field):
+    """Значение поля так же, как в Serializer.to_representation."""
+    def read(instance):
+        try:
+            attribute = field.get_attribute(instance)
+        except SkipField:
+            return SKIP
+        if isinstance(attribute, PKOnlyObject):
+            check_for_none = attribute.pk
+        else:
+            check_for_none = attribute
+        if check_for_none is None:
+            return None
+        return field.to_representation(attribute)
+    return read
+
+
+def performer_representation(performer):
+    return OrderedDict((('id', performer.id), ('name', performer.name)))
+
+
+class FastReadMixin:
+    """Быстрое чтение без обхода полей DRF для каждой строки.
+
+    Включается флагом fast_read в контексте. Для каждого поля один раз
+    выбирается способ чтения: метод read_<поле>, прямое чтение атрибута
+    модели или обычная логика поля DRF. Результат совпадает с обычной
+    сериализацией.
+    """
+
+    def get_readers(self):
+        readers = getattr(self, '_readers', None)
+        if readers is None:
+            readers = []
+            for field in self._readable_fields:
+                name = field.field_name
+                reader = getattr(self, f'read_{name}', None)
+                if (reader is None and type(field) in SIMPLE_FIELDS and
+                        field.source != '*' and '.' not in field.source):
+                    reader = attrgetter(field.source)
+                readers.append((name, reader or field_reader(field)))
+            self._readers = readers
+        return readers
+
+    def to_representation(self, instance):
+        if not self.context.get('fast_read'):
+            return super().to_representation(instance)
+        ret = OrderedDict()
+        for name, reader in self.get_readers():
+            value = reader(instance)
+            if value is not SKIP:
+                ret[name] = value
+        return ret
+
 
 class PlaylistInSerializer(serializers.ModelSerializer):
     id = serializers.PrimaryKeyRelatedField(queryset=Playlist.objects.all(),
@@ -19,10 +125,14 @@ class PlaylistInSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'track_number',)
 
     def get_track_number(self, playlist):
+        track_numbers = self.context.get('track_numbers')
+        if track_numbers is not None:
+            return track_numbers[playlist.id]
         track = self.context['track']
-        playlist_track = PlaylistTrack.objects.get(playlist=playlist,
-                                                   track=track)
-        return playlist_track.track_number
+        playlist_track = PlaylistTrack.objects.with_position_lookup().get(
+            playlist=playlist, track=track
+        )
+        return playlist_track.position
 
 
 class PerformerInSerializer(serializers.ModelSerializer):
@@ -41,12 +151,21 @@ class CreatePlaylistTrackSerializer(serializers.ModelSerializer):
                                             source='track')
     title = serializers.ReadOnlyField(source='track.title')
     author = PerformerInSerializer(source='track.author', read_only=True)
-    track_number = serializers.ReadOnlyField()
+    track_number = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = PlaylistTrack
         fields = ('id', 'title', 'author', 'track_number',)
 
+    def get_track_number(self, playlist_track):
+        position = getattr(playlist_track, 'position', None)
+        if position is None:
+            position = PlaylistTrack.objects.filter(
+                playlist_id=playlist_track.playlist_id,
+                track_number__lte=playlist_track.track_number
+            ).count()
+        return position
+
 
 class TrackInSerializer(serializers.ModelSerializer):
     track_number = serializers.SerializerMethodField()
@@ -57,9 +176,10 @@ class TrackInSerializer(serializers.ModelSerializer):
 
     def get_track_number(self, track):
         playlist = self.context.get('playlist')
-        playlist_track = PlaylistTrack.objects.get(track=track,
-                                                   playlist=playlist)
-        return playlist_track.track_number
+        playlist_track = PlaylistTrack.objects.with_position_lookup().get(
+            track=track, playlist=playlist
+        )
+        return playlist_track.position
 
 
 class AlbumInSerializer(serializers.ModelSerializer):
@@ -70,20 +190,9 @@ class AlbumInSerializer(serializers.ModelSerializer):
         fields = ('id', 'title',)
 
 
-class TracksListInSerializer(serializers.ModelSerializer):
-    album = serializers.SerializerMethodField(method_name='get_album')
-
-    class Meta:
-        model = Track
-        fields = ('id', 'title', 'album',)
-
-    def get_album(self, track):
-        if track.album.first():
-            return AlbumInSerializer(track.album.first()).data
-        return 'Single'
-
-
-class PlaylistSerializer(serializers.ModelSerializer):
+class PlaylistSerializer(SparseFieldsMixin, FastReadMixin,
+                         serializers.ModelSerializer):
+    expandable_fields = ('tracks', 'is_favorite')
     tracks = CreatePlaylistTrackSerializer(many=True,
                                            required=True,
                                            source='playlisttrack_set')
@@ -105,23 +214,29 @@ class PlaylistSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         tracks_data = validated_data.pop('playlisttrack_set')
         playlist = Playlist.objects.create(**validated_data)
-
-        for track in tracks_data:
-            playlist_track = PlaylistTrack(
-                playlist=playlist,
-                track=track.get('track')
-            )
-            playlist_track.save()
-
+        PlaylistTrack.bulk_append(
+            playlist, [track.get('track').pk for track in tracks_data]
+        )
+        invalidate_playlist_responses([playlist.pk])
         return playlist
 
     def get_is_favorite(self, playlist):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated and
-            FavoritePlaylist.objects.filter(user=user,
-                                            playlist=playlist).exists()
-        )
+        favorites = get_request_favorites(self.context)
+        return favorites is not None and playlist.id in favorites.playlists
+
+    def read_tracks(self, playlist):
+        get_track_number = self.fields['tracks'].child.get_track_number
+        return [
+            OrderedDict((
+                ('id', playlist_track.track_id),
+                ('title', playlist_track.track.title),
+                ('author', performer_representation(
+                    playlist_track.track.author
+                )),
+                ('track_number', get_track_number(playlist_track)),
+            ))
+            for playlist_track in playlist.playlisttrack_set.all()
+        ]
 
 
 class TrackInAlbumSerializer(serializers.ModelSerializer):
@@ -135,7 +250,9 @@ class TrackInAlbumSerializer(serializers.ModelSerializer):
         fields = ('id', 'title',)
 
 
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(SparseFieldsMixin, FastReadMixin,
+                      serializers.ModelSerializer):
+    expandable_fields = ('tracks', 'is_favorited')
     author = PerformerInSerializer(required=True)
     tracks = TrackInAlbumSerializer(many=True,
                                     required=True,
@@ -161,42 +278,53 @@ class AlbumSerializer(serializers.ModelSerializer):
                 {'error': 'Нельзя создавать альбом не своего исполнителя'}
             )
 
-        title = validated_data.get('title')
-        err_msg = 'У этого исполнителя уже существует альбом с таким названием'
-        if Album.objects.filter(title=title).exists():
-            raise serializers.ValidationError(
-                {'error': err_msg}
-            )
-
         tracks_data = validated_data.pop('albumtrack_set')
         author = validated_data.pop('author')
-        album = Album.objects.create(
-            **validated_data,
-            author=author.get('id')
-        )
-
-        for track in tracks_data:
-            track_author = track.get('track').author
-            if track_author != album.author:
+        err_msg = 'У этого исполнителя уже существует альбом с таким названием'
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    album = Album.objects.create(
+                        **validated_data,
+                        author=author.get('id')
+                    )
+            except IntegrityError:
                 raise serializers.ValidationError(
-                    {'error': 'Нельзя добавлять в альбом треки другого автора'}
+                    {'error': err_msg}
+                )
+
+            track_err_msg = 'Нельзя добавлять в альбом треки другого автора'
+            for track in tracks_data:
+                track_author = track.get('track').author
+                if track_author != album.author:
+                    raise serializers.ValidationError(
+                        {'error': track_err_msg}
+                    )
+                AlbumTrack.objects.create(
+                    album=album,
+                    track=track.get('track')
                 )
-            AlbumTrack.objects.create(
-                album=album,
-                track=track.get('track')
-            )
 
         return album
 
     def get_is_favorited(self, album):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated and
-            FavoriteAlbum.objects.filter(user=user, album=album).exists()
-        )
+        favorites = get_request_favorites(self.context)
+        return favorites is not None and album.id in favorites.albums
+
+    def read_author(self, album):
+        return performer_representation(album.author)
+
+    def read_tracks(self, album):
+        return [
+            OrderedDict((('id', album_track.track_id),
+                         ('title', album_track.track.title)))
+            for album_track in album.albumtrack_set.all()
+        ]
 
 
-class PerformerSerializer(serializers.ModelSerializer):
+class PerformerSerializer(SparseFieldsMixin, FastReadMixin,
+                          serializers.ModelSerializer):
+    expandable_fields = ('tracks', 'albums')
     tracks = serializers.SerializerMethodField(method_name='get_tracks',
                                                read_only=True,
                                                required=False)
@@ -208,14 +336,22 @@ class PerformerSerializer(serializers.ModelSerializer):
         model = Performer
         fields = ('id', 'name', 'tracks', 'albums')
 
+    def get_discography(self, author):
+        discographies = self.context.get('discographies') or {}
+        if author.pk not in discographies:
+            discographies = get_discographies([author.pk])
+        return discographies[author.pk]
+
     def get_tracks(self, author):
-        return TracksListInSerializer(author.tracks.all(), many=True).data
+        return self.get_discography(author)['tracks']
 
     def get_albums(self, author):
-        return AlbumInSerializer(author.album_set.all(), many=True).data
+        return self.get_discography(author)['albums']
 
 
-class TrackSerializer(serializers.ModelSerializer):
+class TrackSerializer(SparseFieldsMixin, FastReadMixin,
+                      serializers.ModelSerializer):
+    expandable_fields = ('playlists', 'albums', 'is_favorite')
     author = PerformerInSerializer(required=True)
     playlists = serializers.SerializerMethodField(method_name='get_playlists',
                                                   read_only=True)
@@ -244,10 +380,18 @@ class TrackSerializer(serializers.ModelSerializer):
 
         is_playlist = validated_data.get('playlists')
         playlist_data = validated_data.pop('playlists') if is_playlist else []
-        track = Track.objects.create(
-            title=validated_data.get('title'),
-            author=validated_data.get('author').get('id')
-        )
+        try:
+            with transaction.atomic():
+                track = Track.objects.create(
+                    title=validated_data.get('title'),
+                    author=validated_data.get('author').get('id')
+                )
+        except IntegrityError:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Трек с таким названием уже есть у этого исполнителя'
+                ]
+            })
         if is_playlist:
             for playlist in playlist_data:
                 playlist_obj = Playlist.objects.get(id=playlist['id'].id)
@@ -257,50 +401,87 @@ class TrackSerializer(serializers.ModelSerializer):
                 )
         return track
 
-    def validate(self, data):
-        is_track = Track.objects.filter(
-            title=data['title'],
-            author=data.get('author').get('id')
-        ).exists()
-        if is_track:
-            raise serializers.ValidationError(
-                'Трек с таким названием уже есть у этого исполнителя'
-            )
-        return data
-
     def get_playlists(self, track):
-        playlists = Playlist.objects.filter(playlisttrack__track=track)
-        return PlaylistInSerializer(playlists,
-                                    context={'track': track},
-                                    many=True).data
+        playlist_tracks = track.playlisttrack_set.all()
+        if playlist_tracks and not hasattr(playlist_tracks[0], 'position'):
+            playlist_tracks = track.playlisttrack_set.select_related(
+                'playlist'
+            ).with_position_lookup()
+        return PlaylistInSerializer(
+            [playlist_track.playlist for playlist_track in playlist_tracks],
+            context={
+                'track': track,
+                'track_numbers': {
+                    playlist_track.playlist_id: playlist_track.position
+                    for playlist_track in playlist_tracks
+                },
+            },
+            many=True
+        ).data
 
     def get_albums(self, track):
-        album = Album.objects.filter(albumtrack__track=track)
-        return AlbumInSerializer(album,
+        return AlbumInSerializer(track.album.all(),
                                  context={'track': track},
                                  many=True).data
 
     def get_is_favorite(self, track):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated and
-            FavoriteTrack.objects.filter(user=user, track=track).exists()
-        )
+        favorites = get_request_favorites(self.context)
+        return favorites is not None and track.id in favorites.tracks
+
+    def read_author(self, track):
+        return performer_representation(track.author)
+
+    def read_playlists(self, track):
+        playlist_tracks = track.playlisttrack_set.all()
+        if playlist_tracks and not hasattr(playlist_tracks[0], 'position'):
+            return self.get_playlists(track)
+        return [
+            OrderedDict((('id', playlist_track.playlist_id),
+                         ('title', playlist_track.playlist.title),
+                         ('track_number', playlist_track.position)))
+            for playlist_track in playlist_tracks
+        ]
+
+    def read_albums(self, track):
+        return [OrderedDict((('id', album.id), ('title', album.title)))
+                for album in track.album.all()]
 
 
 class AddTrackListSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='playlist.id')
     title = serializers.ReadOnlyField(source='playlist.title')
-    tracks = serializers.PrimaryKeyRelatedField(queryset=Track.objects.all(),
-                                                many=True,
-                                                required=True)
+    tracks = serializers.ListField(child=serializers.IntegerField(),
+                                   required=True)
 
     class Meta:
         model = Playlist
         fields = ('id', 'title', 'tracks',)
 
+    def validate_tracks(self, value):
+        track_ids = list(dict.fromkeys(value))
+        existing = set(
+            Track.objects.filter(id__in=track_ids).values_list('id',
+                                                               flat=True)
+        )
+        missing = [track_id for track_id in track_ids
+                   if track_id not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                f'Треки {missing} не существуют.'
+            )
+        return track_ids
+
+
+class MoveTrackSerializer(serializers.Serializer):
+    track = serializers.IntegerField()
+    position = serializers.IntegerField(min_value=1)
+
 
-class UserSerializer(serializers.ModelSerializer):
+class MoveTrackListSerializer(serializers.Serializer):
+    moves = MoveTrackSerializer(many=True, allow_empty=False)
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = User
@@ -349,7 +530,7 @@ class PlaylistFavoriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'date_of_create', 'amount_tracks',)
 
     def get_amount_tracks(self, playlist):
-        return playlist.tracks.all().count()
+        return playlist.tracks_count
 
 
 class TrackFavoriteSerializer(serializers.ModelSerializer):
@@ -377,4 +558,20 @@ class AlbumFavoriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'author', 'release_date', 'amount_tracks',)
 
     def get_amount_tracks(self, album):
-        return album.tracks.all().count()
+        return album.tracks_count
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=256)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=128)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT,
+                                     default=10)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    stream = serializers.ChoiceField(choices=list(RENDERERS),
+                                     default='jsonl')
@@ -0,0 +1,193 @@
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from music.models import (Album, AlbumTrack, FavoriteAlbum, FavoritePlaylist,
+                          FavoriteTrack, Performer, Playlist, PlaylistTrack,
+                          Track)
+from music.signals import bulk_created
+
+from .autocomplete import (change_album_popularity, change_track_popularity,
+                           remove_suggestion, update_suggestion)
+from .discography import (invalidate_discographies,
+                          invalidate_track_discographies)
+from .cache import invalidate_playlist_responses, invalidate_responses
+from .favorites import favorites_cache
+from .search import remove_document, update_document
+
+
+@receiver((post_save, post_delete), sender=Track)
+def track_changed(sender, instance, created=False, **kwargs):
+    invalidate_discographies([instance.author_id])
+    invalidate_responses('tracks', [instance.pk])
+    if kwargs['signal'] is post_save and not created:
+        invalidate_responses('albums', AlbumTrack.objects.filter(
+            track=instance
+        ).values_list('album_id', flat=True))
+        invalidate_responses('playlists', PlaylistTrack.objects.filter(
+            track=instance
+        ).values_list('playlist_id', flat=True))
+
+
+@receiver(post_save, sender=Performer)
+def performer_saved(sender, instance, created, **kwargs):
+    update_document('performers', instance.pk, instance.name)
+    update_suggestion('performers', instance.pk, instance.name)
+    invalidate_responses('performers', [instance.pk])
+    if not created:
+        invalidate_responses('tracks', Track.objects.filter(
+            author=instance
+        ).values_list('id', flat=True))
+        invalidate_responses('albums', Album.objects.filter(
+            author=instance
+        ).values_list('id', flat=True))
+        invalidate_responses('playlists', PlaylistTrack.objects.filter(
+            track__author=instance
+        ).values_list('playlist_id', flat=True))
+
+
+@receiver(post_save, sender=Track)
+def track_saved(sender, instance, **kwargs):
+    update_document('tracks', instance.pk, instance.title)
+    update_suggestion('tracks', instance.pk, instance.title,
+                      instance.author_id)
+
+
+@receiver(post_save, sender=Album)
+def album_saved(sender, instance, **kwargs):
+    update_document('albums', instance.pk, instance.title)
+    update_suggestion('albums', instance.pk, instance.title)
+
+
+@receiver(post_delete, sender=Performer)
+def performer_deleted(sender, instance, **kwargs):
+    remove_document('performers', instance.pk)
+    remove_suggestion('performers', instance.pk)
+    invalidate_responses('performers', [instance.pk])
+
+
+@receiver(post_delete, sender=Track)
+def track_deleted(sender, instance, **kwargs):
+    remove_document('tracks', instance.pk)
+    remove_suggestion('tracks', instance.pk)
+
+
+@receiver(post_delete, sender=Album)
+def album_deleted(sender, instance, **kwargs):
+    remove_document('albums', instance.pk)
+    remove_suggestion('albums', instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Album)
+def album_changed(sender, instance, **kwargs):
+    tracks = dict(
+        Track.objects.filter(album=instance).values_list('id', 'author_id')
+    )
+    invalidate_discographies([instance.author_id, *tracks.values()])
+    invalidate_responses('albums', [instance.pk])
+    invalidate_responses('tracks', tracks)
+
+
+@receiver((post_save, post_delete), sender=AlbumTrack)
+def album_track_changed(sender, instance, **kwargs):
+    invalidate_track_discographies([instance.track_id])
+    invalidate_responses('albums', [instance.album_id])
+    invalidate_responses('tracks', [instance.track_id])
+
+
+@receiver((post_save, post_delete), sender=Playlist)
+def playlist_changed(sender, instance, **kwargs):
+    invalidate_playlist_responses([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=PlaylistTrack)
+def playlist_track_changed(sender, instance, created=True, **kwargs):
+    # Трек, добавленный в конец или удалённый, сдвигает только треки после
+    # него; про сохранённый с другим номером этого не сказать.
+    low = instance.track_number if created else None
+    invalidate_playlist_responses([instance.playlist_id], low)
+    invalidate_responses('tracks', [instance.track_id])
+
+
+@receiver(bulk_created, sender=Performer)
+def performers_bulk_created(sender, pks, **kwargs):
+    invalidate_responses('performers', pks)
+
+
+@receiver(bulk_created, sender=Album)
+def albums_bulk_created(sender, pks, **kwargs):
+    invalidate_discographies(Album.objects.filter(pk__in=pks).values_list(
+        'author_id', flat=True
+    ))
+    invalidate_responses('albums', pks)
+
+
+@receiver(bulk_created, sender=Track)
+def tracks_bulk_created(sender, pks, **kwargs):
+    invalidate_discographies(Track.objects.filter(pk__in=pks).values_list(
+        'author_id', flat=True
+    ))
+    invalidate_responses('tracks', pks)
+
+
+@receiver(bulk_created, sender=AlbumTrack)
+def album_tracks_bulk_created(sender, pks, **kwargs):
+    rows = AlbumTrack.objects.filter(pk__in=pks).values_list('album_id',
+                                                             'track_id')
+    album_ids = {album_id for album_id, _ in rows}
+    track_ids = {track_id for _, track_id in rows}
+    invalidate_track_discographies(track_ids)
+    invalidate_responses('albums', album_ids)
+    invalidate_responses('tracks', track_ids)
+
+
+@receiver(bulk_created, sender=PlaylistTrack)
+def playlist_tracks_bulk_created(sender, pks, **kwargs):
+    appended = PlaylistTrack.objects.filter(pk__in=pks).values(
+        'playlist_id'
+    ).annotate(low=Min('track_number')).values_list('playlist_id', 'low')
+    for playlist_id, low in appended:
+        invalidate_playlist_responses([playlist_id], low)
+
+
+@receiver(post_save, sender=FavoriteTrack)
+def favorite_track_created(sender, instance, created, **kwargs):
+    if created:
+        favorites_cache.update(instance.user_id, 'tracks',
+                               instance.track_id, added=True)
+        change_track_popularity(instance, 1)
+
+
+@receiver(post_delete, sender=FavoriteTrack)
+def favorite_track_deleted(sender, instance, **kwargs):
+    favorites_cache.update(instance.user_id, 'tracks',
+                           instance.track_id, added=False)
+    change_track_popularity(instance, -1)
+
+
+@receiver(post_save, sender=FavoriteAlbum)
+def favorite_album_created(sender, instance, created, **kwargs):
+    if created:
+        favorites_cache.update(instance.user_id, 'albums',
+                               instance.album_id, added=True)
+        change_album_popularity(instance, 1)
+
+
+@receiver(post_delete, sender=FavoriteAlbum)
+def favorite_album_deleted(sender, instance, **kwargs):
+    favorites_cache.update(instance.user_id, 'albums',
+                           instance.album_id, added=False)
+    change_album_popularity(instance, -1)
+
+
+@receiver(post_save, sender=FavoritePlaylist)
+def favorite_playlist_created(sender, instance, created, **kwargs):
+    if created:
+        favorites_cache.update(instance.user_id, 'playlists',
+                               instance.playlist_id, added=True)
+
+
+@receiver(post_delete, sender=FavoritePlaylist)
+def favorite_playlist_deleted(sender, instance, **kwargs):
+    favorites_cache.update(instance.user_id, 'playlists',
+                           instance.playlist_id, added=False)
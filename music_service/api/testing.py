@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+
+from .querycount import QueryStats, get_budget
+
+
+@contextmanager
+def query_budget(route=None, queries=None, duplicates=None):
+    """Проверяет, что блок укладывается в бюджет запросов к базе.
+
+    Бюджет берётся из QUERY_BUDGETS для маршрута route, queries и
+    duplicates его переопределяют:
+
+        with query_budget('api:tracks-list', duplicates=1):
+            client.get('/api/tracks/')
+    """
+    budget = get_budget(route)
+    if queries is not None:
+        budget['queries'] = queries
+    if duplicates is not None:
+        budget['duplicates'] = duplicates
+    stats = QueryStats()
+    with stats.collect():
+        yield stats
+    problems = stats.violations(budget)
+    if problems:
+        raise AssertionError('; '.join(problems))
@@ -0,0 +1,1002 @@
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import skipIf
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from music.counters import actual_count, resolve_counters
+from music.exporter import export_chunks
+from music.importer import CatalogImporter
+from music.models import (TRACK_NUMBER_STEP, Album, AlbumTrack, FavoriteAlbum,
+                          FavoritePlaylist, FavoriteTrack, Performer, Playlist,
+                          PlaylistTrack, Track)
+from music_service.db.pool import ConnectionPool, PoolTimeout
+from users.models import User
+
+from .autocomplete import autocomplete_index
+from .querycount import QueryBudgetExceeded
+from .renderers import ORJSONRenderer, dumps, orjson
+from .search import search_index
+from .testing import query_budget
+from .urls import router
+
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+}
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+def create_catalog(tracks=60):
+    user = User.objects.create_user(
+        username='listener', email='listener@example.com', password='pass'
+    )
+    performers = [
+        Performer.objects.create(name=f'Исполнитель {i}', created_by=user)
+        for i in range(3)
+    ]
+    albums = [
+        Album.objects.create(
+            title=f'Альбом {i}', author=performer, created_by=user,
+            release_date=datetime.date(2000 + i, 1, 1)
+        )
+        for i, performer in enumerate(performers)
+    ]
+    track_ids = []
+    for i in range(tracks):
+        track = Track.objects.create(title=f'Трек {i}',
+                                     author=performers[i % 3])
+        track_ids.append(track.pk)
+        if i % 2:
+            AlbumTrack.objects.create(album=albums[i % 3], track=track)
+        if i % 3 == 0:
+            FavoriteTrack.objects.create(user=user, track=track)
+    for i in range(2):
+        playlist = Playlist.objects.create(
+            title=f'Плейлист {i}', created_by=user,
+            description=f'Описание {i}' if i else None
+        )
+        PlaylistTrack.bulk_append(playlist, track_ids[i::2])
+        FavoritePlaylist.objects.create(user=user, playlist=playlist)
+    FavoriteAlbum.objects.create(user=user, album=albums[0])
+    return user
+
+
+@override_settings(CACHES=NO_CACHE)
+class ListQueriesTests(TestCase):
+    """Число запросов к базе не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_constant_queries(self, url):
+        # Первый запрос ещё загружает избранное пользователя в кэш процесса.
+        self.client.get(f'{url}?limit=1')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(f'{url}?limit=2').status_code,
+                             200)
+        # Журнал запросов соединения очищается в начале каждого запроса.
+        expected = len(queries)
+        for limit in (10, 20, 50):
+            # Ни один запрос не повторяется для каждой строки страницы.
+            with query_budget(queries=expected, duplicates=1):
+                response = self.client.get(f'{url}?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_tracks(self):
+        self.assert_constant_queries('/api/tracks/')
+
+    def test_favourite_tracks(self):
+        favorites = FavoriteTrack.objects.filter(user=self.user)
+        FavoriteTrack.objects.bulk_create(
+            FavoriteTrack(user=self.user, track=track)
+            for track in Track.objects.exclude(
+                pk__in=favorites.values('track_id')
+            )
+        )
+        self.assert_constant_queries('/api/tracks/favourites/')
+
+
+@override_settings(CACHES=NO_CACHE,
+                   QUERY_BUDGETS={'api:tracks-list': {'queries': 1}})
+class QueryBudgetTests(TestCase):
+    """Выход за бюджет запросов виден в логе или роняет запрос."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=6)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_warning(self):
+        with self.assertLogs('api.queries', 'INFO') as logs:
+            self.client.get('/api/tracks/')
+            self.client.get('/api/albums/')
+        warnings = [record for record in logs.records
+                    if record.levelname == 'WARNING']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('"route": "api:tracks-list"', warnings[0].getMessage())
+        self.assertIn('budget_exceeded', warnings[0].getMessage())
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/api/tracks/')
+        self.assertEqual(self.client.get('/api/albums/').status_code, 200)
+
+    def test_query_budget(self):
+        with self.assertRaises(AssertionError):
+            with query_budget('api:tracks-list'):
+                self.client.get('/api/albums/')
+        with query_budget('api:tracks-list', queries=10):
+            self.client.get('/api/albums/')
+
+
+@override_settings(CACHES=NO_CACHE)
+class KeysetPaginationTests(TestCase):
+    """Страницы по курсору идут без COUNT(*) и не сдвигаются от удалений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=30)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_walk(self):
+        track_ids = list(Track.objects.order_by('pk').values_list('pk',
+                                                                  flat=True))
+        url = '/api/tracks/?pagination=keyset&limit=7&fields=id'
+        with CaptureQueriesContext(connection) as first_page:
+            response = self.client.get(url)
+        self.assertNotIn('count', response.data)
+        self.assertFalse([query for query in first_page
+                          if 'COUNT(' in query['sql']])
+        # Удалённая строка уже отданной страницы не сдвигает следующие.
+        Track.objects.filter(pk=track_ids[0]).delete()
+        seen = [track['id'] for track in response.data['results']]
+        while response.data['next']:
+            with self.assertNumQueries(len(first_page)):
+                response = self.client.get(response.data['next'])
+            seen += [track['id'] for track in response.data['results']]
+        self.assertEqual(seen, track_ids)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([track['id'] for track in response.data['results']],
+                         track_ids[21:28])
+        response = self.client.get(f'{url}&count=exact')
+        self.assertEqual(response.data['count'], len(track_ids) - 1)
+
+
+@override_settings(CACHES=NO_CACHE)
+class FavouritesTests(TestCase):
+    """Избранное отдаётся страницами или потоком JSON-строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=30)
+        other = User.objects.create_user(
+            username='other', email='other@example.com', password='pass'
+        )
+        FavoriteTrack.objects.create(
+            user=other, track=Track.objects.exclude(
+                favorite_tracks__user=cls.user
+            ).first()
+        )
+        cls.favourites = {
+            'tracks': FavoriteTrack.objects.filter(user=cls.user),
+            'albums': FavoriteAlbum.objects.filter(user=cls.user),
+            'playlists': FavoritePlaylist.objects.filter(user=cls.user),
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected(self, resource):
+        field = resource[:-1]
+        return sorted(self.favourites[resource].values_list(f'{field}_id',
+                                                            flat=True))
+
+    def test_pages(self):
+        for resource in self.favourites:
+            with self.subTest(resource=resource):
+                url = f'/api/{resource}/favourites/?limit=4'
+                # Первый запрос ещё загружает флаги избранного в кэш.
+                self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.data['count'],
+                                 len(self.expected(resource)))
+                # Избранное присоединяется к выборке, а не списком id.
+                self.assertFalse([query for query in queries
+                                  if 'FROM "music_favorite' in query['sql']])
+                self.assertTrue([query for query in queries
+                                 if 'JOIN "music_favorite' in query['sql']])
+                ids = []
+                while url:
+                    response = self.client.get(url)
+                    ids += [obj['id'] for obj in response.data['results']]
+                    url = response.data['next']
+                self.assertEqual(ids, self.expected(resource))
+        response = self.client.get('/api/playlists/favourites/')
+        self.assertIn('description', response.data['results'][0])
+
+    def test_stream(self):
+        for resource in self.favourites:
+            with self.subTest(resource=resource):
+                response = self.client.get(
+                    f'/api/{resource}/favourites/?stream=jsonl&fields=id'
+                )
+                self.assertEqual(response['Content-Type'],
+                                 'application/x-ndjson')
+                lines = b''.join(response.streaming_content).splitlines()
+                self.assertEqual([json.loads(line) for line in lines],
+                                 [{'id': pk}
+                                  for pk in self.expected(resource)])
+
+
+@override_settings(CACHES=NO_CACHE)
+class ConditionalGetTests(TestCase):
+    """ETag ответа зависит от выбранных полей, но не от их порядка."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=6)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def etag(self, query=''):
+        track = Track.objects.first()
+        return self.client.get(f'/api/tracks/{track.pk}/{query}')['ETag']
+
+    def test_field_selection(self):
+        self.assertNotEqual(self.etag(), self.etag('?fields=id'))
+        self.assertNotEqual(self.etag('?fields=id'),
+                            self.etag('?fields=id&expand=playlists'))
+        self.assertEqual(self.etag('?fields=id,title'),
+                         self.etag('?fields=title,id'))
+
+    def test_not_modified(self):
+        etag = self.etag('?fields=id')
+        track = Track.objects.first()
+        response = self.client.get(f'/api/tracks/{track.pk}/?fields=id',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f'/api/tracks/{track.pk}/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class FastReadTests(TestCase):
+    """Быстрый путь сериализации отдаёт ответ, побайтно равный обычному."""
+    CASES = (
+        ('tracks', ''),
+        ('tracks', 'fields=id,title'),
+        ('tracks', 'expand=playlists'),
+        ('tracks', 'fields=id,is_favorite&expand=albums'),
+        ('albums', ''),
+        ('albums', 'fields=id,release_date&expand=tracks'),
+        ('playlists', ''),
+        ('playlists', 'expand=tracks'),
+        ('performers', ''),
+        ('performers', 'fields=name&expand=albums'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=30)
+
+    def render(self, resource, query, fast, action):
+        viewset = next(viewset for prefix, viewset, _ in router.registry
+                       if prefix == resource)
+        request = APIRequestFactory().get(f'/api/{resource}/?{query}')
+        force_authenticate(request, self.user)
+        kwargs = {}
+        if action == 'retrieve':
+            kwargs['pk'] = viewset.queryset.model.objects.order_by('pk')[1].pk
+        view = viewset(action_map={'get': action}, args=(), kwargs=kwargs,
+                       format_kwarg=None)
+        view.request = view.initialize_request(request)
+        view.headers = {}
+        view.fast_read_actions = (action,) if fast else ()
+        if action == 'retrieve':
+            serializer = view.get_serializer(view.get_object())
+        else:
+            serializer = view.get_serializer(list(view.get_queryset()),
+                                             many=True)
+        return JSONRenderer().render(serializer.data)
+
+    def test_same_output(self):
+        for action in ('list', 'retrieve'):
+            for resource, query in self.CASES:
+                with self.subTest(action=action, resource=resource,
+                                  query=query):
+                    self.assertEqual(
+                        self.render(resource, query, True, action),
+                        self.render(resource, query, False, action)
+                    )
+
+
+@override_settings(CACHES=NO_CACHE)
+class PlaylistTracksTests(TestCase):
+    """Треки плейлистов и альбомов добавляются и удаляются пачкой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=60)
+        cls.track_ids = list(
+            Track.objects.order_by('pk').values_list('pk', flat=True)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_playlist(self, track_ids=()):
+        playlist = Playlist.objects.create(title='Новый плейлист',
+                                           created_by=self.user)
+        PlaylistTrack.bulk_append(playlist, track_ids)
+        return playlist
+
+    def change_tracks(self, obj, method, track_ids):
+        prefix = 'albums' if isinstance(obj, Album) else 'playlists'
+        return getattr(self.client, method)(
+            f'/api/{prefix}/{obj.pk}/add_tracks/', {'tracks': track_ids},
+            format='json'
+        )
+
+    def track_order(self, playlist):
+        return list(PlaylistTrack.objects.filter(playlist=playlist).order_by(
+            'track_number'
+        ).values_list('track_id', flat=True))
+
+    def test_playlist(self):
+        small, large = self.create_playlist(), self.create_playlist()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                self.change_tracks(small, 'post', self.track_ids[:2])
+                .status_code, 200
+            )
+        with self.assertNumQueries(len(queries)):
+            response = self.change_tracks(large, 'post', self.track_ids[:50])
+        self.assertEqual([track['id'] for track in response.data['tracks']],
+                         self.track_ids[:50])
+
+        # Неизвестный трек отклоняет всю пачку.
+        response = self.change_tracks(large, 'post',
+                                      [self.track_ids[55], 10 ** 6])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.track_order(large), self.track_ids[:50])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                self.change_tracks(small, 'delete', self.track_ids[:1])
+                .status_code, 204
+            )
+        with self.assertNumQueries(len(queries)):
+            response = self.change_tracks(large, 'delete',
+                                          self.track_ids[10:40])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.track_order(large),
+                         self.track_ids[:10] + self.track_ids[40:50])
+        large.refresh_from_db()
+        self.assertEqual(large.tracks_count, 20)
+
+    def test_numbering(self):
+        playlist = self.create_playlist(self.track_ids[:3])
+        # Резерв номеров — два запроса при любой длине плейлиста.
+        with self.assertNumQueries(2):
+            last = playlist.reserve_track_numbers(2)
+        self.assertEqual(last, 5 * TRACK_NUMBER_STEP)
+        PlaylistTrack.objects.filter(playlist=playlist,
+                                     track_id=self.track_ids[2]).delete()
+        PlaylistTrack.bulk_append(playlist, self.track_ids[3:5])
+        PlaylistTrack.objects.create(playlist=playlist,
+                                     track_id=self.track_ids[5])
+        # Номера удалённых и зарезервированных треков не выдаются снова.
+        self.assertEqual(
+            list(PlaylistTrack.objects.filter(playlist=playlist).order_by(
+                'track_number'
+            ).values_list('track_number', flat=True)),
+            [number * TRACK_NUMBER_STEP for number in (1, 2, 6, 7, 8)]
+        )
+        response = self.client.get(f'/api/playlists/{playlist.pk}/')
+        self.assertEqual(
+            [(track['id'], track['track_number'])
+             for track in response.data['tracks']],
+            [(self.track_ids[i], i + 1) for i in (0, 1)]
+            + [(self.track_ids[i], i) for i in (3, 4, 5)]
+        )
+
+    def move(self, playlist, moves, expected):
+        """Переносит треки и сверяет порядок с тем же переносом в списке."""
+        for track_id, position in moves:
+            expected.remove(track_id)
+            expected.insert(position - 1, track_id)
+        response = self.client.post(
+            f'/api/playlists/{playlist.pk}/move_tracks/',
+            {'moves': [{'track': track_id, 'position': position}
+                       for track_id, position in moves]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([track['id'] for track in response.data['tracks']],
+                         expected)
+        self.assertEqual(self.track_order(playlist), expected)
+
+    def test_move(self):
+        track_ids = self.track_ids[:10]
+        playlist = self.create_playlist(track_ids)
+        expected = list(track_ids)
+
+        def numbers():
+            return dict(PlaylistTrack.objects.filter(
+                playlist=playlist
+            ).values_list('track_id', 'track_number'))
+
+        before = numbers()
+        self.move(playlist, [(track_ids[9], 1)], expected)
+        after = numbers()
+        # Номер меняется только у перенесённого трека.
+        self.assertEqual({track_id for track_id in before
+                          if before[track_id] != after[track_id]},
+                         {track_ids[9]})
+        self.move(playlist, [(track_ids[0], 10), (track_ids[5], 2),
+                             (track_ids[3], 4)], expected)
+
+        # Без промежутков между номерами трек переносится после
+        # перенумерации всего плейлиста.
+        for number, track_id in enumerate(expected, 1):
+            PlaylistTrack.objects.filter(
+                playlist=playlist, track_id=track_id
+            ).update(track_number=number)
+        self.move(playlist, [(expected[-1], 3)], expected)
+        rebalanced = numbers()
+        del rebalanced[expected[2]]
+        self.assertEqual(sorted(rebalanced.values()),
+                         [i * TRACK_NUMBER_STEP for i in range(1, 10)])
+
+        response = self.client.post(
+            f'/api/playlists/{playlist.pk}/move_tracks/',
+            {'moves': [{'track': self.track_ids[20], 'position': 1}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_album(self):
+        album = Album.objects.create(
+            title='Новый альбом', author=Performer.objects.first(),
+            created_by=self.user, release_date=datetime.date(2020, 1, 1)
+        )
+        response = self.change_tracks(album, 'post', self.track_ids[:30])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['tracks']), 30)
+        response = self.change_tracks(album, 'post', self.track_ids[25:35])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.change_tracks(album, 'delete', self.track_ids[:20])
+            .status_code, 204
+        )
+        album.refresh_from_db()
+        self.assertEqual(album.tracks_count, 10)
+        self.assertEqual(
+            set(album.tracks.values_list('pk', flat=True)),
+            set(self.track_ids[20:30])
+        )
+
+
+@override_settings(CACHES=NO_CACHE)
+class UniqueConstraintTests(TestCase):
+    """Дубликаты отсекает уникальный индекс, а API отвечает на них 400."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=6)
+        cls.performers = list(Performer.objects.order_by('pk'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, resource, title, performer, **data):
+        return self.client.post(f'/api/{resource}/', {
+            'title': title, 'author': {'id': performer.pk}, **data
+        }, format='json')
+
+    def test_track(self):
+        response = self.post('tracks', 'Трек 0', self.performers[0])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+        # То же название у другого исполнителя — другой трек.
+        response = self.post('tracks', 'Трек 0', self.performers[1])
+        self.assertEqual(response.status_code, 201)
+
+    def test_album(self):
+        data = {'release_date': '2020-01-01', 'tracks': []}
+        response = self.post('albums', 'Альбом 0', self.performers[0],
+                             **data)
+        self.assertEqual(response.status_code, 400)
+        response = self.post('albums', 'Альбом 0', self.performers[1],
+                             **data)
+        self.assertEqual(response.status_code, 201)
+
+    def test_favourites(self):
+        track = Track.objects.exclude(favorite_tracks__user=self.user)[0]
+        album = Album.objects.exclude(favorite_albums__user=self.user)[0]
+        for url in (f'/api/tracks/{track.pk}/favorite/',
+                    f'/api/albums/{album.pk}/favorite/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(track.favorite_tracks.count(), 1)
+        self.assertEqual(album.favorite_albums.count(), 1)
+
+
+@override_settings(CACHES=NO_CACHE)
+class CountersTests(TestCase):
+    """Счётчики треков и избранного совпадают с числом строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=12)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_counters(self):
+        for model, field, row_model, link in resolve_counters(apps):
+            with self.subTest(counter=f'{model.__name__}.{field}'):
+                self.assertFalse(model.objects.exclude(
+                    **{field: actual_count(row_model, link)}
+                ).exists())
+
+    def test_api_changes(self):
+        self.assert_counters()
+        track = Track.objects.exclude(favorite_tracks__user=self.user)[0]
+        album = Album.objects.exclude(favorite_albums__user=self.user)[0]
+        self.client.post(f'/api/tracks/{track.pk}/favorite/')
+        self.client.post(f'/api/albums/{album.pk}/favorite/')
+        track.refresh_from_db()
+        album.refresh_from_db()
+        self.assertEqual((track.favorites_count, album.favorites_count),
+                         (1, 1))
+        self.assert_counters()
+
+        self.client.delete(f'/api/tracks/{track.pk}/favorite/')
+        track_ids = list(Track.objects.filter(author=album.author).exclude(
+            albumtrack__album=album
+        ).values_list('pk', flat=True))
+        self.client.post(f'/api/albums/{album.pk}/add_tracks/',
+                         {'tracks': track_ids}, format='json')
+        track.refresh_from_db()
+        album.refresh_from_db()
+        self.assertEqual(track.favorites_count, 0)
+        self.assertEqual(album.tracks_count, album.albumtrack_set.count())
+        self.assert_counters()
+
+        performer = album.author
+        tracks_count = performer.tracks_count
+        for url in (f'/api/tracks/{track_ids[0]}/',
+                    f'/api/playlists/{Playlist.objects.first().pk}/'):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        performer.refresh_from_db()
+        self.assertEqual(performer.tracks_count, tracks_count - 1)
+        self.assert_counters()
+
+    def test_reconcile(self):
+        Track.objects.update(favorites_count=5)
+        Playlist.objects.update(tracks_count=0)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('Track.favorites_count: исправлено строк 12',
+                      out.getvalue())
+        self.assert_counters()
+
+
+@override_settings(CACHES=NO_CACHE)
+class ExportTests(TestCase):
+    """Выгрузка идёт кусками и совпадает с тем, что отдаёт API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=20)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, kind, file_format):
+        response = self.client.get(f'/api/export/{kind}/?stream={file_format}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_playlist_positions(self):
+        playlist = Playlist.objects.first()
+        last = playlist.playlisttrack_set.order_by('track_number').last()
+        self.client.post(f'/api/playlists/{playlist.pk}/move_tracks/', {
+            'moves': [{'track': last.track_id, 'position': 2}]
+        }, format='json')
+        exported = [json.loads(line) for line in
+                    self.export('playlist_tracks', 'jsonl').splitlines()]
+        tracks = self.client.get(f'/api/playlists/{playlist.pk}/').data[
+            'tracks'
+        ]
+        self.assertEqual(
+            [(row['track_id'], row['track_number']) for row in exported
+             if row['playlist'] == playlist.pk],
+            [(track['id'], track['track_number']) for track in tracks]
+        )
+
+    def test_round_trip(self):
+        rows = list(csv.DictReader(StringIO(self.export('tracks', 'csv'))))
+        self.assertEqual(len(rows), Track.objects.count())
+        # Выгрузку понимает загрузка, и повторно она ничего не добавляет.
+        self.assertEqual(CatalogImporter(self.user).import_batch(
+            'tracks', list(enumerate(rows, 2))
+        ), (0, []))
+
+    def test_chunks(self):
+        self.assertEqual(
+            len(list(export_chunks('album_tracks', 'jsonl', chunk_size=4))),
+            -(-AlbumTrack.objects.count() // 4)
+        )
+        with TemporaryDirectory() as directory:
+            call_command('export_catalog', 'album_tracks', chunk_size=4,
+                         output_dir=directory, stdout=StringIO())
+            with open(os.path.join(directory, 'album_tracks.jsonl'),
+                      encoding='utf-8') as file:
+                self.assertEqual(len(file.readlines()),
+                                 AlbumTrack.objects.count())
+        self.assertEqual(
+            APIClient().get('/api/export/tracks/').status_code, 401
+        )
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Пул отдаёт соединения повторно и не открывает лишних."""
+
+    def connect(self):
+        return sqlite3.connect(':memory:', check_same_thread=False)
+
+    def test_reuse(self):
+        pool = ConnectionPool(size=2)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        second = pool.acquire(self.connect)
+        self.assertIsNot(second, first)
+        self.assertEqual(
+            pool.snapshot(),
+            {'size': 2, 'open': 2, 'idle': 0, 'checkouts': 3, 'connects': 2}
+        )
+
+    def test_wait(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        connection = pool.acquire(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.connect)
+        # Ждущий поток получает соединение, как только его вернут.
+        pool.timeout = 5
+        timer = threading.Timer(0.05, pool.release, (connection,))
+        timer.start()
+        self.assertIs(pool.acquire(self.connect), connection)
+        timer.join()
+        self.assertEqual((pool.stats['waits'], pool.stats['timeouts'],
+                          pool.stats['connects']), (2, 1, 1))
+
+    def test_health_check(self):
+        pool = ConnectionPool(size=1, check_after=0)
+        connection = pool.acquire(self.connect)
+        pool.release(connection)
+        connection.close()
+        fresh = pool.acquire(self.connect)
+        self.assertIsNot(fresh, connection)
+        fresh.execute('SELECT 1')
+        self.assertEqual((pool.stats['discarded'], pool.stats['connects']),
+                         (1, 2))
+        self.assertEqual(pool.snapshot()['open'], 1)
+
+
+class RendererTests(TestCase):
+    """Разделители строк экранируются так же, как в JSONRenderer."""
+    DATA = {'title': 'Трек\u2028один\u2029два', 'tags': ['\u2028']}
+
+    def test_dumps(self):
+        self.assertEqual(dumps(self.DATA),
+                         JSONRenderer().render(self.DATA))
+
+    @skipIf(orjson is None, 'orjson не установлен')
+    def test_orjson(self):
+        self.assertEqual(ORJSONRenderer().render(self.DATA),
+                         JSONRenderer().render(self.DATA))
+
+
+class SearchTests(TestCase):
+    """Поиск и подсказки доступны тем же, кому доступны исполнители."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=6)
+
+    def setUp(self):
+        search_index.reset()
+        autocomplete_index.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_anonymous(self):
+        client = APIClient()
+        for url in ('/api/search/?q=трек', '/api/search/autocomplete/?q=тр',
+                    '/api/performers/'):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 401)
+
+    def test_popularity(self):
+        track = Track.objects.exclude(favorite_tracks__user=self.user)[0]
+        index = autocomplete_index.get()
+
+        def popularity():
+            return (index.documents['tracks', track.pk][1],
+                    index.documents['performers', track.author_id][1])
+
+        before = popularity()
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteTrack.objects.create(user=self.user, track_id=track.pk)
+        self.assertEqual(popularity(), (before[0] + 1, before[1] + 1))
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                FavoriteTrack.objects.filter(track=track).delete()
+        self.assertEqual(popularity(), before)
+        # Исполнитель трека берётся из индекса, а не из базы.
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith('SELECT')
+                          and 'FROM "music_track"' in query['sql']])
+
+
+@override_settings(CACHES=NO_CACHE)
+class DestroyQueriesTests(TestCase):
+    """Удаление с каскадом не делает запросов на каждую строку."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=300)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_playlist(self, size):
+        playlist = Playlist.objects.create(title=f'Плейлист на {size}',
+                                           created_by=self.user)
+        PlaylistTrack.bulk_append(
+            playlist, Track.objects.values_list('id', flat=True)[:size]
+        )
+        FavoritePlaylist.objects.create(user=self.user, playlist=playlist)
+        return playlist
+
+    def test_playlist(self):
+        small = self.create_playlist(3)
+        large = self.create_playlist(3 * GET_ITERATOR_CHUNK_SIZE)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(f'/api/playlists/{small.pk}/')
+        self.assertEqual(response.status_code, 204)
+        # Строки плейлиста Django удаляет пачками по GET_ITERATOR_CHUNK_SIZE.
+        with self.assertNumQueries(len(queries) + 2):
+            response = self.client.delete(f'/api/playlists/{large.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(PlaylistTrack.objects.filter(playlist=large).exists())
+
+
+class ImportTests(TestCase):
+    """Повторная загрузка ничего не добавляет и не меняет счётчики."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=6)
+
+    def load(self, kind, rows):
+        return CatalogImporter(self.user).import_batch(
+            kind, list(enumerate(rows, 1))
+        )
+
+    def test_idempotent(self):
+        tracks = [
+            {'title': 'Трек 0', 'author': 'Исполнитель 0'},
+            {'title': 'Трек 0', 'author': 'Исполнитель 1'},
+            {'title': 'Новый', 'author': 'Исполнитель 2'},
+            {'title': 'Новый', 'author': 'Исполнитель 2'},
+        ]
+        album_tracks = [
+            {'album': 'Альбом 1', 'author': 'Исполнитель 1', 'track': title,
+             'track_author': author}
+            for title, author in (('Трек 0', 'Исполнитель 1'),
+                                  ('Трек 1', 'Исполнитель 1'),
+                                  ('Новый', 'Исполнитель 2'))
+        ]
+        self.assertEqual(self.load('tracks', tracks), (2, []))
+        self.assertEqual(self.load('album_tracks', album_tracks), (2, []))
+        counters = (
+            list(Performer.objects.values_list('pk', 'tracks_count')),
+            list(Album.objects.values_list('pk', 'tracks_count')),
+        )
+        self.assertEqual(self.load('tracks', tracks), (0, []))
+        self.assertEqual(self.load('album_tracks', album_tracks), (0, []))
+        self.assertEqual(Track.objects.count(), 8)
+        self.assertEqual(counters, (
+            list(Performer.objects.values_list('pk', 'tracks_count')),
+            list(Album.objects.values_list('pk', 'tracks_count')),
+        ))
+        album = Album.objects.get(title='Альбом 1')
+        self.assertEqual(album.tracks_count, album.tracks.count())
+
+    def test_created_only(self):
+        # Строки, уже бывшие в базе к вставке, не считаются добавленными.
+        existing = Track.objects.first()
+        created = CatalogImporter(self.user).create(Track, [
+            Track(title=existing.title, author_id=existing.author_id),
+            Track(title=existing.title, author_id=existing.author_id + 1),
+        ], ('title', 'author_id'))
+        self.assertEqual(list(created),
+                         [(existing.title, existing.author_id + 1)])
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1', '10.1.0.0/16'],
+                   METRICS_TOKEN='secret')
+class MetricsAccessTests(TestCase):
+    """Метрики отдаются только разрешённым адресам или по токену."""
+
+    def status(self, address, **headers):
+        return self.client.get('/metrics/', REMOTE_ADDR=address,
+                               **headers).status_code
+
+    def test_access(self):
+        self.assertEqual(self.status('127.0.0.1'), 200)
+        self.assertEqual(self.status('10.1.2.3'), 200)
+        self.assertEqual(self.status('10.2.0.1'), 403)
+        self.assertEqual(
+            self.status('10.2.0.1', HTTP_AUTHORIZATION='Bearer secret'), 200
+        )
+        self.assertEqual(
+            self.status('10.2.0.1', HTTP_AUTHORIZATION='Bearer wrong'), 403
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ResponseCacheTests(TestCase):
+    """Ответ без флагов избранного кэшируется один для всех пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(tracks=6)
+        cls.other = User.objects.create_user(
+            username='other', email='other@example.com', password='pass'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(url)['X-Cache']
+
+    def test_shared(self):
+        for url in ('/api/tracks/?fields=id,title&expand=albums',
+                    '/api/albums/?fields=id,title', '/api/performers/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.get(self.user, url), 'MISS')
+                self.assertEqual(self.get(self.other, url), 'HIT')
+
+    def test_per_user(self):
+        # Без ?fields= и ?expand= в ответе все поля, в том числе флаги.
+        for url in ('/api/tracks/', '/api/albums/?expand=is_favorited'):
+            with self.subTest(url=url):
+                self.assertEqual(self.get(self.user, url), 'MISS')
+                self.assertEqual(self.get(self.other, url), 'MISS')
+                self.assertEqual(self.get(self.user, url), 'HIT')
+
+
+@override_settings(
+    CACHES=LOCAL_CACHE, DATABASE_REPLICAS=['replica1'],
+    DATABASE_ROUTERS=['music_service.db.replicas.ReplicaRouter'],
+    MIDDLEWARE=[*settings.MIDDLEWARE,
+                'music_service.db.replicas.ReplicaMiddleware'],
+)
+class ReplicaTests(TransactionTestCase):
+    """После записи пользователь читает из основной базы, а не из реплики.
+
+    Реплика — второе соединение с той же тестовой базой, поэтому данные в
+    ней видны только после коммита. Псевдоним добавляется на время тестов
+    класса: в настройках реплики задаются только через DB_REPLICAS.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica1'] = {
+            **connections['default'].settings_dict,
+            'TEST': {'MIRROR': 'default'},
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.clients = {}
+        for name in ('writer', 'reader'):
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass'
+            )
+            self.login(name)
+
+    def login(self, name):
+        """Новый токен пользователя, как после повторного входа."""
+        Token.objects.filter(user__username=name).delete()
+        token = Token.objects.create(user=User.objects.get(username=name))
+        self.clients[name] = APIClient()
+        self.clients[name].credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def request(self, name, method, url, **kwargs):
+        """Ответ и число запросов к основной базе и к реплике."""
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica1']) as replica:
+                response = getattr(self.clients[name], method)(url, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_read_after_write(self):
+        response, _, replica = self.request(
+            'writer', 'post', '/api/performers/', data={'name': 'Новый'}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(replica, 0)
+        url = f'/api/performers/{response.data["id"]}/'
+
+        # Отметка о записи привязана к пользователю, а не к токену.
+        self.login('writer')
+        response, primary, replica = self.request('writer', 'get', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(primary, 1)
+        self.assertEqual(replica, 0)
+
+        # Токен ищется в основной базе, данные — в реплике.
+        response, primary, replica = self.request('reader', 'get', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 1)
+        self.assertGreater(replica, 0)
@@ -4,7 +4,8 @@ from drf_yasg.views import get_schema_view
 from rest_framework import permissions, routers
 from rest_framework.authtoken import views
 
-from .views import (AlbumViewSet, PerformerViewSet, PlaylistViewSet,
+from .views import (AlbumViewSet, AutocompleteView, CatalogExportView,
+                    PerformerViewSet, PlaylistViewSet, SearchView,
                     TrackViewSet, UserViewSet)
 
 app_name = 'api'
@@ -31,6 +32,10 @@ schema_view = get_schema_view(
 
 
 urlpatterns = [
+    path('search/', SearchView.as_view(), name='search'),
+    path('search/autocomplete/', AutocompleteView.as_view(),
+         name='autocomplete'),
+    path('export/<str:kind>/', CatalogExportView.as_view(), name='export'),
     path('', include(router.urls)),
     path('token/', views.obtain_auth_token),
     path('swagger/',
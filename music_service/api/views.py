@@ -1,42 +1,202 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from music.counters import batch_counters, change_counter
+from music.exporter import EXPORTS, export_chunks
 from music.models import (Album, AlbumTrack, FavoriteAlbum, FavoritePlaylist,
                           FavoriteTrack, Performer, Playlist, PlaylistTrack,
                           Track)
 from users.models import User
 
+from .autocomplete import autocomplete_index
+from .cache import (CachedResponseMixin, ConditionalGetMixin,
+                    batch_invalidation, invalidate_playlist_responses,
+                    invalidate_responses)
+from .discography import (deferred_invalidation, get_discographies,
+                          invalidate_track_discographies)
 from .pagination import CustomPagination
 from .permissions import CustomUserPermissions
+from .renderers import dumps
+from .search import search_index
 from .serializers import (AddTrackListSerializer, AlbumFavoriteSerializer,
-                          AlbumSerializer, PasswordSerializer,
-                          PerformerSerializer, PlaylistFavoriteSerializer,
-                          PlaylistSerializer, TrackFavoriteSerializer,
-                          TrackSerializer, UserSerializer)
+                          AlbumSerializer, AutocompleteQuerySerializer,
+                          ExportQuerySerializer, MoveTrackListSerializer,
+                          PasswordSerializer, PerformerSerializer,
+                          PlaylistFavoriteSerializer, PlaylistSerializer,
+                          SearchQuerySerializer, SparseFieldsMixin,
+                          TrackFavoriteSerializer, TrackSerializer,
+                          UserSerializer)
+
+
+STREAM_CHUNK_SIZE = 500
+
+
+def split_names(value):
+    return [name.strip() for name in (value or '').split(',')
+            if name.strip()]
+
+
+class SparseFieldsViewMixin:
+    """Настраивает сериализатор на чтение.
+
+    Передаёт ему ?fields= и ?expand=, а для действий из fast_read_actions
+    включает быстрый путь сериализации. wants_field() сообщает, попадёт
+    ли поле в ответ, чтобы get_queryset не подгружал лишние связи.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    fast_read_actions = ('list', 'retrieve', 'favourites')
+
+    def get_field_selection(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        if not issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            return None
+        params = request.query_params
+        if (self.fields_query_param not in params and
+                self.expand_query_param not in params):
+            return None
+        return {
+            'fields': split_names(params.get(self.fields_query_param)) or None,
+            'expand': split_names(params.get(self.expand_query_param)),
+        }
+
+    def wants_field(self, name):
+        if getattr(self, 'action', None) == 'destroy':
+            # Удалённый объект не сериализуется: связи ему не нужны.
+            return False
+        selection = self.get_field_selection()
+        if selection is None or name in selection['expand']:
+            return True
+        if selection['fields'] is not None:
+            return name in selection['fields']
+        return name not in self.get_serializer_class().expandable_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fast_read'] = (
+            getattr(self, 'action', None) in self.fast_read_actions
+        )
+        return context
+
+    def get_serializer(self, *args, **kwargs):
+        selection = self.get_field_selection()
+        if selection is not None:
+            kwargs.update(selection)
+        return super().get_serializer(*args, **kwargs)
+
+
+class FavouritesMixin:
+    stream_query_param = 'stream'
+
+    def get_favourites_response(self, queryset):
+        if self.request.query_params.get(self.stream_query_param) == 'jsonl':
+            return StreamingHttpResponse(
+                self.stream_jsonl(queryset),
+                content_type='application/x-ndjson'
+            )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def stream_jsonl(self, queryset):
+        chunk = []
+        for obj in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE):
+            chunk.append(obj)
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield self.render_jsonl(chunk)
+                chunk = []
+        if chunk:
+            yield self.render_jsonl(chunk)
+
+    def render_jsonl(self, objs):
+        serializer = self.get_serializer(objs, many=True)
+        return b''.join(dumps(item) + b'\n' for item in serializer.data)
 
 
-class PerformerViewSet(viewsets.ModelViewSet):
+class CascadeDestroyMixin:
+    """Удаляет объект с зависимыми строками за несколько запросов.
+
+    Каскад шлёт post_delete на каждую удалённую строку; счётчики, версии
+    ответов и дискографии при этом копятся и меняются пачкой.
+    """
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), batch_invalidation():
+            with deferred_invalidation(), batch_counters():
+                super().perform_destroy(instance)
+
+
+class PerformerViewSet(ConditionalGetMixin, CachedResponseMixin,
+                       SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Performer.objects.all()
     http_method_names = ['get', 'post']
     serializer_class = PerformerSerializer
     permission_classes = (IsAuthenticated,)
     pagination_class = CustomPagination
     filter_backends = [filters.SearchFilter]
-    search_fields = ['title']
+    search_fields = ['name']
+    cache_namespace = 'performers'
+    cache_per_user = False
+
+    def get_queryset(self):
+        return Performer.objects.order_by('id')
+
+    def get_serializer(self, *args, **kwargs):
+        discography = self.wants_field('tracks') or self.wants_field('albums')
+        if args and self.action in ('list', 'retrieve') and discography:
+            performers = args[0] if kwargs.get('many') else [args[0]]
+            context = self.get_serializer_context()
+            context['discographies'] = get_discographies(
+                [performer.pk for performer in performers]
+            )
+            kwargs['context'] = context
+        return super().get_serializer(*args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
 
-class PlaylistViewSet(viewsets.ModelViewSet):
+class PlaylistViewSet(ConditionalGetMixin, CascadeDestroyMixin,
+                      FavouritesMixin, SparseFieldsViewMixin,
+                      viewsets.ModelViewSet):
     queryset = Playlist.objects.all()
     serializer_class = PlaylistSerializer
     http_method_names = ['get', 'post', 'delete']
     pagination_class = CustomPagination
 
+    def get_queryset(self):
+        queryset = Playlist.objects.order_by('id')
+        if self.wants_field('tracks'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'playlisttrack_set',
+                queryset=PlaylistTrack.objects.select_related(
+                    'track__author'
+                ).with_position()
+            ))
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        # Перечитываем с prefetch и номерами треков, иначе каждый трек
+        # ответа стоит нескольких запросов.
+        serializer = self.get_serializer(
+            self.get_queryset().get(pk=serializer.instance.pk)
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers=self.get_success_headers(serializer.data))
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
@@ -54,45 +214,103 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        tracks_data = request.data.get('tracks', [])
         serializer = AddTrackListSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        track_ids = serializer.validated_data['tracks']
 
-        if request.method == 'POST':
-            existing_tracks = playlist.tracks.all().values_list('id', flat=True)
-            tracks_obj = []
+        with transaction.atomic(), batch_invalidation():
+            existing_tracks = set(PlaylistTrack.objects.filter(
+                playlist=playlist, track_id__in=track_ids
+            ).values_list('track_id', flat=True))
 
-            for track_id in tracks_data:
-                if track_id in existing_tracks:
+            if request.method == 'POST':
+                if existing_tracks:
                     return Response(
-                        {'error': f'Трек {track_id} уже есть в плейлисте.'},
+                        {'error': f'Треки {sorted(existing_tracks)} '
+                                  f'уже есть в плейлисте.'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
-                track = get_object_or_404(Track, pk=track_id)
-                tracks_obj.append(track)
+                playlist_tracks = PlaylistTrack.bulk_append(playlist,
+                                                            track_ids)
+                if playlist_tracks:
+                    invalidate_playlist_responses(
+                        [playlist.pk], playlist_tracks[0].track_number
+                    )
+                serializer = PlaylistSerializer(
+                    self.get_queryset().get(pk=playlist.pk),
+                    context=self.get_serializer_context()
+                )
+                return Response(serializer.data, status=status.HTTP_200_OK)
 
-            for track in tracks_obj:
-                playlist_track = PlaylistTrack(
-                    playlist=playlist,
-                    track=track
+            missing = [track_id for track_id in track_ids
+                       if track_id not in existing_tracks]
+            if missing:
+                return Response(
+                    {'error': f'Треки {missing} не добавлены в плейлист'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                playlist_track.save()
+            with batch_counters():
+                PlaylistTrack.objects.filter(
+                    playlist=playlist, track_id__in=track_ids
+                ).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
-            serializer = PlaylistSerializer(playlist)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+    @action(
+        detail=True, methods=['post'],
+        serializer_class=MoveTrackListSerializer,
+        url_name='move_tracks',
+    )
+    def move_tracks(self, request, pk=None):
+        playlist = get_object_or_404(Playlist, pk=pk)
+        if request.user != playlist.created_by:
+            return Response(
+                {'error': 'Нельзя менять порядок треков не в своем плейлисте'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        if request.method == 'DELETE':
-            for track in tracks_data:
-                if PlaylistTrack.objects.filter(
-                    playlist=playlist, track=track
-                ).exists():
-                    PlaylistTrack.objects.get(playlist=playlist,
-                                              track=track).delete()
-                    return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = MoveTrackListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moves = serializer.validated_data['moves']
+
+        with transaction.atomic(), batch_invalidation():
+            playlist = Playlist.objects.select_for_update().get(pk=pk)
+            playlist_tracks = {
+                playlist_track.track_id: playlist_track
+                for playlist_track in PlaylistTrack.objects.filter(
+                    playlist=playlist,
+                    track_id__in=[move['track'] for move in moves]
+                ).with_position_lookup()
+            }
+            missing = [move['track'] for move in moves
+                       if move['track'] not in playlist_tracks]
+            if missing:
                 return Response(
-                    {'error': f'Трек {track} не добавлен в альбом'},
+                    {'error': f'Треки {missing} не добавлены в плейлист'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            for move in moves:
+                playlist.move_track(playlist_tracks[move['track']],
+                                    move['position'])
+            # Переносы переставляют только треки между старыми и новыми
+            # позициями перенесённых.
+            positions = [move['position'] for move in moves] + [
+                playlist_track.position
+                for playlist_track in playlist_tracks.values()
+            ]
+            numbers = PlaylistTrack.objects.filter(
+                playlist=playlist
+            ).order_by('track_number').values_list('track_number', flat=True)
+            first, last = min(positions), max(positions)
+            invalidate_playlist_responses(
+                [playlist.pk], numbers[first - 1],
+                next(iter(numbers[last - 1:last]), None)
+            )
+
+        serializer = PlaylistSerializer(
+            self.get_queryset().get(pk=playlist.pk),
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         detail=True, methods=['post', 'delete'],
@@ -103,21 +321,23 @@ class PlaylistViewSet(viewsets.ModelViewSet):
         playlist = get_object_or_404(Playlist, pk=kwargs['pk'])
 
         if request.method == 'POST':
-            if FavoritePlaylist.objects.filter(user=user,
-                                               playlist=playlist).exists():
+            try:
+                with transaction.atomic():
+                    FavoritePlaylist.objects.create(user=user,
+                                                    playlist=playlist)
+            except IntegrityError:
                 return Response(
                     {'errors': 'Плейлист уже добавлен в избранное'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             serializer = PlaylistFavoriteSerializer(playlist)
-            FavoritePlaylist.objects.create(user=user, playlist=playlist)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if FavoritePlaylist.objects.filter(user=user,
-                                               playlist=playlist).exists():
-                FavoritePlaylist.objects.get(user=user,
-                                             playlist=playlist).delete()
+            deleted, _ = FavoritePlaylist.objects.filter(
+                user=user, playlist=playlist
+            ).delete()
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {'errors': 'Плейлист не был добавлен в избранное'},
@@ -130,24 +350,36 @@ class PlaylistViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def favourites(self, request, *args, **kwargs):
-        user = request.user
-        favorites_playlists = FavoritePlaylist.objects.filter(
-            user=user
-        ).values_list('playlist', flat=True)
-        playlists = Playlist.objects.filter(id__in=favorites_playlists)
-        serializer = AlbumSerializer(playlists,
-                                     many=True,
-                                     context={'request': request})
-        return Response(serializer.data)
+        return self.get_favourites_response(
+            self.get_queryset().filter(favorite_playlists__user=request.user)
+        )
 
 
-class TrackViewSet(viewsets.ModelViewSet):
+class TrackViewSet(ConditionalGetMixin, CachedResponseMixin,
+                   CascadeDestroyMixin, FavouritesMixin,
+                   SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Track.objects.all()
     serializer_class = TrackSerializer
     http_method_names = ['get', 'post', 'delete']
     pagination_class = CustomPagination
     filter_backends = [filters.SearchFilter]
     search_fields = ['title']
+    cache_namespace = 'tracks'
+
+    def get_queryset(self):
+        queryset = Track.objects.order_by('id')
+        if self.wants_field('author'):
+            queryset = queryset.select_related('author')
+        if self.wants_field('playlists'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'playlisttrack_set',
+                queryset=PlaylistTrack.objects.select_related(
+                    'playlist'
+                ).with_position_lookup()
+            ))
+        if self.wants_field('albums'):
+            queryset = queryset.prefetch_related('album')
+        return queryset
 
     @action(
         detail=True, methods=['post', 'delete'],
@@ -158,18 +390,22 @@ class TrackViewSet(viewsets.ModelViewSet):
         track = get_object_or_404(Track, pk=kwargs['pk'])
 
         if request.method == 'POST':
-            if FavoriteTrack.objects.filter(user=user, track=track).exists():
+            try:
+                with transaction.atomic():
+                    FavoriteTrack.objects.create(user=user, track=track)
+            except IntegrityError:
                 return Response(
                     {'errors': 'Трек уже добавлен в избранное'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             serializer = TrackFavoriteSerializer(track)
-            FavoriteTrack.objects.create(user=user, track=track)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if FavoriteTrack.objects.filter(user=user, track=track).exists():
-                FavoriteTrack.objects.get(user=user, track=track).delete()
+            deleted, _ = FavoriteTrack.objects.filter(
+                user=user, track=track
+            ).delete()
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {'errors': 'Трек не был добавлен в избранное'},
@@ -182,18 +418,13 @@ class TrackViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def favourites(self, request, *args, **kwargs):
-        user = request.user
-        favorites_tracks = FavoriteTrack.objects.filter(
-            user=user
-        ).values_list('track', flat=True)
-        tracks = Track.objects.filter(id__in=favorites_tracks)
-        serializer = TrackSerializer(tracks,
-                                     many=True,
-                                     context={'request': request})
-        return Response(serializer.data)
+        return self.get_favourites_response(
+            self.get_queryset().filter(favorite_tracks__user=request.user)
+        )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(CascadeDestroyMixin, SparseFieldsViewMixin,
+                  viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (CustomUserPermissions,)
@@ -219,13 +450,27 @@ class UserViewSet(viewsets.ModelViewSet):
         )
 
 
-class AlbumViewSet(viewsets.ModelViewSet):
+class AlbumViewSet(ConditionalGetMixin, CachedResponseMixin,
+                   CascadeDestroyMixin, FavouritesMixin,
+                   SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Album.objects.all()
     serializer_class = AlbumSerializer
     http_method_names = ['get', 'post', 'delete']
     pagination_class = CustomPagination
     filter_backends = [filters.SearchFilter]
     search_fields = ['title']
+    cache_namespace = 'albums'
+
+    def get_queryset(self):
+        queryset = Album.objects.order_by('id')
+        if self.wants_field('author'):
+            queryset = queryset.select_related('author')
+        if self.wants_field('tracks'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'albumtrack_set',
+                queryset=AlbumTrack.objects.select_related('track')
+            ))
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -245,45 +490,50 @@ class AlbumViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        tracks_data = request.data.get('tracks', [])
         serializer = AddTrackListSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        track_ids = serializer.validated_data['tracks']
 
-        if request.method == 'POST':
-            existing_tracks = album.tracks.all().values_list('id', flat=True)
-            tracks_obj = []
+        discographies = deferred_invalidation()
+        with discographies, transaction.atomic(), batch_invalidation():
+            existing_tracks = set(AlbumTrack.objects.filter(
+                album=album, track_id__in=track_ids
+            ).values_list('track_id', flat=True))
 
-            for track_id in tracks_data:
-                if track_id in existing_tracks:
+            if request.method == 'POST':
+                if existing_tracks:
                     return Response(
-                        {'error': f'Трек {track_id} уже есть в альбоме.'},
+                        {'error': f'Треки {sorted(existing_tracks)} '
+                                  f'уже есть в альбоме.'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
-                track = get_object_or_404(Track, pk=track_id)
-                tracks_obj.append(track)
-
-            for track in tracks_obj:
-                album_track = AlbumTrack(
-                    album=album,
-                    track=track
+                AlbumTrack.objects.bulk_create([
+                    AlbumTrack(album=album, track_id=track_id)
+                    for track_id in track_ids
+                ])
+                change_counter(Album, 'tracks_count', album.pk,
+                               len(track_ids))
+                invalidate_track_discographies(track_ids)
+                invalidate_responses('albums', [album.pk])
+                invalidate_responses('tracks', track_ids)
+                serializer = AlbumSerializer(
+                    self.get_queryset().get(pk=album.pk),
+                    context=self.get_serializer_context()
                 )
-                album_track.save()
-
-            serializer = PlaylistSerializer(album)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+                return Response(serializer.data, status=status.HTTP_200_OK)
 
-        if request.method == 'DELETE':
-            for track in tracks_data:
-                if AlbumTrack.objects.filter(
-                    album=album, track=track
-                ).exists():
-                    PlaylistTrack.objects.get(album=album,
-                                              track=track).delete()
-                    return Response(status=status.HTTP_204_NO_CONTENT)
+            missing = [track_id for track_id in track_ids
+                       if track_id not in existing_tracks]
+            if missing:
                 return Response(
-                    {'error': f'Трек {track} не добавлен в альбом'},
+                    {'error': f'Треки {missing} не добавлены в альбом'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            with batch_counters():
+                AlbumTrack.objects.filter(
+                    album=album, track_id__in=track_ids
+                ).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True, methods=['post', 'delete'],
@@ -294,18 +544,22 @@ class AlbumViewSet(viewsets.ModelViewSet):
         album = get_object_or_404(Album, pk=kwargs['pk'])
 
         if request.method == 'POST':
-            if FavoriteAlbum.objects.filter(user=user, album=album).exists():
+            try:
+                with transaction.atomic():
+                    FavoriteAlbum.objects.create(user=user, album=album)
+            except IntegrityError:
                 return Response(
                     {'errors': 'Альбом уже добавлен в избранное'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             serializer = AlbumFavoriteSerializer(album)
-            FavoriteAlbum.objects.create(user=user, album=album)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if FavoriteAlbum.objects.filter(user=user, album=album).exists():
-                FavoriteAlbum.objects.get(user=user, album=album).delete()
+            deleted, _ = FavoriteAlbum.objects.filter(
+                user=user, album=album
+            ).delete()
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {'errors': 'Альбом не был добавлен в избранное'},
@@ -318,12 +572,54 @@ class AlbumViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def favourites(self, request, *args, **kwargs):
-        user = request.user
-        favorites_albums = FavoriteAlbum.objects.filter(
-            user=user
-        ).values_list('album', flat=True)
-        albums = Album.objects.filter(id__in=favorites_albums)
-        serializer = AlbumSerializer(albums,
-                                     many=True,
-                                     context={'request': request})
-        return Response(serializer.data)
+        return self.get_favourites_response(
+            self.get_queryset().filter(favorite_albums__user=request.user)
+        )
+
+
+class SearchView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        serializer = SearchQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(search_index.get().search(
+            serializer.validated_data['q'],
+            limit=serializer.validated_data['limit']
+        ))
+
+
+class AutocompleteView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        serializer = AutocompleteQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(autocomplete_index.get().complete(
+            serializer.validated_data['q'],
+            limit=serializer.validated_data['limit']
+        ))
+
+
+class CatalogExportView(APIView):
+    """Выгрузка каталога потоком CSV или JSONL."""
+    permission_classes = (IsAuthenticated,)
+    content_types = {
+        'csv': 'text/csv; charset=utf-8',
+        'jsonl': 'application/x-ndjson',
+    }
+
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            raise NotFound()
+        serializer = ExportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        file_format = serializer.validated_data['stream']
+        response = StreamingHttpResponse(
+            (chunk.encode() for chunk in export_chunks(kind, file_format)),
+            content_type=self.content_types[file_format]
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{kind}.{file_format}"'
+        )
+        return response
@@ -0,0 +1,58 @@
+"""Бенчмарки каталога.
+
+Запускаются из каталога music_service, например:
+    python -m benchmarks.lookups --rows 200000
+Каждый бенчмарк работает на временной тестовой базе и не трогает рабочую.
+"""
+import gc
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'music_service.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat):
+    """Время каждого вызова; сборщик мусора, как в timeit, выключен."""
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return timings
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return {
+        'mean_ms': statistics.mean(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p95_ms': timings[min(len(timings) - 1,
+                              int(len(timings) * 0.95))] * 1000,
+        'p99_ms': timings[min(len(timings) - 1,
+                              int(len(timings) * 0.99))] * 1000,
+    }
@@ -0,0 +1,361 @@
+"""Задержка, число запросов к базе и память на каждый маршрут api.urls.
+
+Каталог создаётся командой seed_catalog с фиксированным зерном, запросы
+идут через тестовый клиент Django. Отчёт пишется в JSON; с --compare
+скрипт сравнивает его с прошлым отчётом и завершается с ошибкой, если
+маршрут стал делать больше запросов к базе или заметно замедлился.
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks import setup, summary, test_database
+
+PASSWORDS = ('bench-password-1', 'bench-password-2')
+NOISE_FLOOR_MS = 1.0
+
+
+def seed(args):
+    from django.core.management import call_command
+
+    from music.models import Album, Performer, Playlist, Track
+
+    call_command(
+        'seed_catalog', users=args.users, performers=args.performers,
+        albums=args.albums, tracks=args.tracks, playlists=args.playlists,
+        favorites=args.favorites, seed=args.seed, stdout=io.StringIO()
+    )
+    heaviest = Playlist.objects.order_by('-tracks_count').first()
+    user = heaviest.created_by
+    user.set_password(PASSWORDS[1])
+    user.save()
+    return {
+        'user': user,
+        'ids': {
+            'user': user.pk,
+            'own_performer': Performer.objects.create(
+                name='Benchmark', created_by=user
+            ).pk,
+            'performer': Performer.objects.order_by(
+                '-tracks_count'
+            ).first().pk,
+            'track': Track.objects.order_by('-favorites_count').first().pk,
+            'album': Album.objects.order_by('-tracks_count').first().pk,
+            'playlist': heaviest.pk,
+        },
+        'hot_tracks': list(Track.objects.order_by(
+            '-favorites_count'
+        ).values_list('pk', flat=True)[:20]),
+    }
+
+
+def scenario(catalog):
+    """Шаги одной итерации: чтения и циклы создания и удаления.
+
+    Путь и тело могут ссылаться на id из catalog['ids'] и на id,
+    сохранённые предыдущими шагами (save).
+    """
+    hot = catalog['hot_tracks']
+    username = catalog['user'].username
+    reads = [
+        '/api/',
+        '/api/search/?q=night city',
+        '/api/search/autocomplete/?q=ni',
+        '/api/export/tracks/',
+        '/api/performers/',
+        '/api/performers/?fields=id,name',
+        '/api/performers/{performer}/',
+        '/api/tracks/',
+        '/api/tracks/?pagination=keyset',
+        '/api/tracks/?fields=id,title',
+        '/api/tracks/{track}/',
+        '/api/tracks/favourites/',
+        '/api/tracks/favourites/?stream=jsonl',
+        '/api/albums/',
+        '/api/albums/{album}/',
+        '/api/albums/favourites/',
+        '/api/playlists/',
+        '/api/playlists/?expand=tracks',
+        '/api/playlists/{playlist}/',
+        '/api/playlists/favourites/',
+        '/api/users/',
+        '/api/users/{user}/',
+        '/api/swagger/',
+        '/api/swagger/?format=openapi',
+        '/api/redoc/',
+    ]
+    steps = [{'method': 'get', 'path': path} for path in reads]
+    steps += [
+        {'method': 'post', 'path': '/api/performers/',
+         'data': lambda ids: {'name': f'Benchmark {ids["n"]}'}},
+        {'method': 'post', 'path': '/api/tracks/', 'save': 'new_track',
+         'data': lambda ids: {'title': f'Benchmark {ids["n"]}',
+                              'author': {'id': ids['own_performer']}}},
+        {'method': 'post', 'path': '/api/tracks/{new_track}/favorite/'},
+        {'method': 'delete', 'path': '/api/tracks/{new_track}/favorite/'},
+        {'method': 'post', 'path': '/api/albums/', 'save': 'new_album',
+         'data': lambda ids: {'title': f'Benchmark {ids["n"]}',
+                              'release_date': '2023-01-01',
+                              'author': {'id': ids['own_performer']},
+                              'tracks': []}},
+        {'method': 'post', 'path': '/api/albums/{new_album}/add_tracks/',
+         'data': lambda ids: {'tracks': [ids['new_track']]}},
+        {'method': 'delete', 'path': '/api/albums/{new_album}/add_tracks/',
+         'data': lambda ids: {'tracks': [ids['new_track']]}},
+        {'method': 'post', 'path': '/api/albums/{new_album}/favorite/'},
+        {'method': 'delete', 'path': '/api/albums/{new_album}/favorite/'},
+        {'method': 'post', 'path': '/api/playlists/', 'save': 'new_playlist',
+         'data': lambda ids: {'title': f'Benchmark {ids["n"]}',
+                              'tracks': []}},
+        {'method': 'post',
+         'path': '/api/playlists/{new_playlist}/add_tracks/',
+         'data': lambda ids: {'tracks': hot}},
+        {'method': 'post',
+         'path': '/api/playlists/{new_playlist}/move_tracks/',
+         'data': lambda ids: {'moves': [{'track': hot[0], 'position': 10}]}},
+        {'method': 'delete',
+         'path': '/api/playlists/{new_playlist}/add_tracks/',
+         'data': lambda ids: {'tracks': hot}},
+        {'method': 'post',
+         'path': '/api/playlists/{new_playlist}/favorite/'},
+        {'method': 'delete',
+         'path': '/api/playlists/{new_playlist}/favorite/'},
+        {'method': 'delete', 'path': '/api/playlists/{new_playlist}/'},
+        {'method': 'delete', 'path': '/api/albums/{new_album}/'},
+        {'method': 'delete', 'path': '/api/tracks/{new_track}/'},
+        {'method': 'post', 'path': '/api/users/', 'save': 'new_user',
+         'data': lambda ids: {
+             'username': f'benchmark-{ids["n"]}',
+             'email': f'benchmark-{ids["n"]}@example.com',
+             'first_name': 'Benchmark', 'last_name': 'User',
+             'password': PASSWORDS[0],
+         }},
+        {'method': 'delete', 'path': '/api/users/{new_user}/'},
+        {'method': 'post', 'path': '/api/token/', 'anonymous': True,
+         'data': lambda ids: {'username': username,
+                              'password': PASSWORDS[ids['n'] % 2]}},
+        {'method': 'post', 'path': '/api/users/set_password/',
+         'data': lambda ids: {
+             'current_password': PASSWORDS[ids['n'] % 2],
+             'new_password': PASSWORDS[(ids['n'] + 1) % 2],
+         }},
+    ]
+    for step in steps:
+        step['name'] = f'{step["method"].upper()} {step["path"]}'
+    return steps
+
+
+def api_routes():
+    """Маршруты api.urls без дублей с суффиксом формата."""
+    from django.urls import URLResolver
+
+    from api import urls
+
+    routes = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns)
+            elif 'format' not in pattern.pattern.regex.groupindex:
+                routes.add(pattern.name or str(pattern.pattern))
+
+    walk(urls.urlpatterns)
+    return routes
+
+
+def route_of(path):
+    from django.urls import resolve
+
+    match = resolve(path.split('?')[0][len('/api'):], urlconf='api.urls')
+    return match.url_name or match.route
+
+
+def perform(clients, step, ids):
+    path = step['path'].format(**ids)
+    data = step.get('data')
+    if callable(data):
+        data = data(ids)
+    client = clients['anonymous' if step.get('anonymous') else 'user']
+    response = getattr(client, step['method'])(path, data, format='json')
+    size = len(b''.join(response.streaming_content)
+               if response.streaming else response.content)
+    if step.get('save') and response.status_code < 400:
+        ids[step['save']] = response.data['id']
+    return path, response.status_code, size
+
+
+def run_iteration(clients, steps, ids, record):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for step in steps:
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            path, status, size = perform(clients, step, ids)
+            elapsed = time.perf_counter() - started
+        record(step, path, status, size, elapsed, len(queries))
+
+
+def profile_iteration(clients, steps, ids, results):
+    for step in steps:
+        tracemalloc.start()
+        try:
+            perform(clients, step, ids)
+            results[step['name']]['peak_kb'] = round(
+                tracemalloc.get_traced_memory()[1] / 1024
+            )
+        finally:
+            tracemalloc.stop()
+
+
+def run(args):
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    caches = settings.CACHES if args.cache else {'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }}
+    results = {}
+    with test_database(), override_settings(CACHES=caches):
+        catalog = seed(args)
+        steps = scenario(catalog)
+        clients = {'user': APIClient(), 'anonymous': APIClient()}
+        clients['user'].force_authenticate(catalog['user'])
+        ids = dict(catalog['ids'], n=0)
+
+        def record(step, path, status, size, elapsed, queries):
+            result = results.setdefault(step['name'], {
+                'route': route_of(path), 'method': step['method'].upper(),
+                'statuses': set(), 'timings': [], 'queries': [],
+                'bytes': size,
+            })
+            result['statuses'].add(status)
+            result['timings'].append(elapsed)
+            result['queries'].append(queries)
+
+        for _ in range(args.warmup):
+            ids['n'] += 1
+            run_iteration(clients, steps, ids, lambda *args: None)
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(args.repeat):
+                ids['n'] += 1
+                run_iteration(clients, steps, ids, record)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        ids['n'] += 1
+        profile_iteration(clients, steps, ids, results)
+        database = connection.vendor
+
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': database,
+        'cache': bool(args.cache),
+        'repeat': args.repeat,
+        'catalog': {name: getattr(args, name) for name in (
+            'users', 'performers', 'albums', 'tracks', 'playlists',
+            'favorites', 'seed',
+        )},
+        'requests': {},
+        'uncovered_routes': sorted(
+            api_routes() - {result['route'] for result in results.values()}
+        ),
+    }
+    for name, result in results.items():
+        report['requests'][name] = {
+            'route': result['route'],
+            'method': result['method'],
+            'status': sorted(result['statuses']),
+            **{key: round(value, 3)
+               for key, value in summary(result['timings']).items()},
+            'queries': max(result['queries']),
+            'peak_kb': result.get('peak_kb'),
+            'bytes': result['bytes'],
+        }
+    return report
+
+
+def compare(report, baseline, threshold):
+    """Маршруты, которые стали медленнее или делают больше запросов."""
+    regressions = []
+    for name, current in report['requests'].items():
+        previous = baseline['requests'].get(name)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов к базе {previous["queries"]} -> '
+                f'{current["queries"]}'
+            )
+        if (current['p50_ms'] > previous['p50_ms'] * threshold and
+                current['p50_ms'] - previous['p50_ms'] > NOISE_FLOOR_MS):
+            regressions.append(
+                f'{name}: p50 {previous["p50_ms"]:.1f} -> '
+                f'{current["p50_ms"]:.1f} мс'
+            )
+    return regressions
+
+
+def print_report(report):
+    print(f'{"request":<58}{"status":>8}{"p50, ms":>9}{"p95, ms":>9}'
+          f'{"p99, ms":>9}{"queries":>9}{"peak, KB":>10}')
+    for name, result in report['requests'].items():
+        status = ','.join(map(str, result['status']))
+        print(f'{name[:57]:<58}{status:>8}{result["p50_ms"]:>9.1f}'
+              f'{result["p95_ms"]:>9.1f}{result["p99_ms"]:>9.1f}'
+              f'{result["queries"]:>9}{result["peak_kb"]:>10}')
+    for route in report['uncovered_routes']:
+        print(f'Маршрут без замеров: {route}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    for name, default in (('users', 50), ('performers', 300),
+                          ('albums', 800), ('tracks', 10000),
+                          ('playlists', 300), ('favorites', 40),
+                          ('seed', 1)):
+        parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument(
+        '--cache', action='store_true',
+        help='Оставить кэш из настроек; по умолчанию ответы не кэшируются',
+    )
+    parser.add_argument('--output', default='benchmark-api.json')
+    parser.add_argument('--compare', help='Прошлый отчёт для сравнения')
+    parser.add_argument(
+        '--threshold', type=float, default=1.25,
+        help='Во сколько раз может вырасти p50 без сигнала о регрессии',
+    )
+    args = parser.parse_args()
+    setup()
+    report = run(args)
+    failed = [
+        name for name, result in report['requests'].items()
+        if max(result['status']) >= 400
+    ]
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            report['regressions'] = compare(report, json.load(file),
+                                            args.threshold)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print_report(report)
+    for name in failed:
+        print(f'Ошибка в ответе: {name}', file=sys.stderr)
+    for regression in report.get('regressions', ()):
+        print(f'Регрессия: {regression}', file=sys.stderr)
+    if failed or report.get('regressions'):
+        sys.exit(1)
@@ -0,0 +1,144 @@
+"""Задержка запросов при новых, постоянных и взятых из пула соединениях.
+
+Каждый режим запускается отдельным процессом с настройками из окружения,
+как их получит gunicorn: DB_ENGINE и DB_CONN_MAX_AGE. Запрос — сигналы
+начала и конца запроса Django вокруг чтения из базы, так что соединения
+закрываются и проверяются так же, как в работающем сервисе.
+
+Без PostgreSQL бенчмарк идёт на SQLite: она открывает соединение за
+десятки микросекунд, и --connect-delay добавляет к каждому открытию
+задержку, сравнимую с установкой соединения с PostgreSQL по сети.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import measure, setup, summary, test_database
+
+MODES = ('new', 'persistent', 'pool')
+
+
+def slow_down_connects(connection, delay):
+    """Задерживает открытие настоящих соединений и считает их."""
+    base = next(
+        cls for cls in type(connection).__mro__
+        if cls.__module__.startswith('django.db.backends.')
+        and 'get_new_connection' in vars(cls)
+    )
+    get_new_connection = base.get_new_connection
+    connects = []
+
+    def connect(self, conn_params):
+        connects.append(1)
+        time.sleep(delay)
+        return get_new_connection(self, conn_params)
+
+    base.get_new_connection = connect
+    return connects
+
+
+def run_mode(args):
+    from django.core.signals import request_finished, request_started
+    from django.db import connection, connections
+
+    from music.models import Performer, Track
+    from music_service.db.pool import pool_stats
+    from users.models import User
+
+    if connection.vendor == 'sqlite':
+        # Соединение с базой SQLite в памяти Django не закрывает никогда.
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            tempfile.mkdtemp(), 'connections.sqlite3'
+        )
+    with test_database():
+        user = User.objects.create(username='bench', email='b@example.com')
+        performer = Performer.objects.create(name='bench', created_by=user)
+        Track.objects.bulk_create(
+            Track(title=f'track {i}', author=performer) for i in range(100)
+        )
+        connections.close_all()
+        connects = slow_down_connects(
+            connections['default'], args.connect_delay / 1000
+        )
+
+        def request():
+            request_started.send(sender=None)
+            list(Track.objects.filter(author=performer)[:20])
+            request_finished.send(sender=None)
+
+        timings = []
+
+        def worker():
+            timings.extend(measure(request, args.requests // args.threads))
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pool = pool_stats().get('default', {})
+
+    return {
+        **summary(timings),
+        'connects': len(connects),
+        'pool_waits': pool.get('waits', 0),
+    }
+
+
+def mode_environment(mode):
+    engine = os.getenv('DB_ENGINE') or 'django.db.backends.sqlite3'
+    vendor = engine.rsplit('.', 1)[-1]
+    environment = {**os.environ, 'DB_NAME': os.getenv('DB_NAME') or 'bench'}
+    if mode == 'pool':
+        environment['DB_ENGINE'] = f'music_service.db.{vendor}'
+        environment['DB_CONN_MAX_AGE'] = '0'
+    else:
+        environment['DB_ENGINE'] = f'django.db.backends.{vendor}'
+        environment['DB_CONN_MAX_AGE'] = '0' if mode == 'new' else '600'
+    return environment
+
+
+def run(args):
+    results = {}
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.connections', '--mode', mode,
+             '--requests', str(args.requests),
+             '--threads', str(args.threads),
+             '--connect-delay', str(args.connect_delay)],
+            env=mode_environment(mode), check=True, stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        results[mode] = json.loads(output.splitlines()[-1])
+
+    print(f'{"mode":<12}{"mean, ms":>10}{"p50, ms":>10}{"p95, ms":>10}'
+          f'{"connects":>10}{"waits":>8}')
+    for mode, result in results.items():
+        print(f'{mode:<12}{result["mean_ms"]:>10.3f}{result["p50_ms"]:>10.3f}'
+              f'{result["p95_ms"]:>10.3f}{result["connects"]:>10}'
+              f'{result["pool_waits"]:>8}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument(
+        '--connect-delay', type=float, default=0,
+        help='Задержка открытия соединения, мс',
+    )
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        os.environ['GUNICORN_THREADS'] = str(args.threads)
+        setup()
+        print(json.dumps(run_mode(args)))
+    else:
+        run(args)
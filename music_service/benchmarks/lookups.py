@@ -0,0 +1,111 @@
+"""Стоимость проверок дубликатов до и после составных уникальных индексов."""
+import argparse
+import random
+
+from benchmarks import measure, setup, summary, test_database
+
+
+def seed(rows):
+    from music.models import (Album, FavoriteAlbum, FavoriteTrack,
+                              Performer, Track)
+    from users.models import User
+
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com')
+        for i in range(max(rows // 1000, 1))
+    )
+    performers = Performer.objects.bulk_create(
+        Performer(name=f'performer {i}', created_by=users[i % len(users)])
+        for i in range(max(rows // 100, 1))
+    )
+    Track.objects.bulk_create(
+        (Track(title=f'track {i}', author=performers[i % len(performers)])
+         for i in range(rows)),
+        batch_size=5000
+    )
+    Album.objects.bulk_create(
+        (Album(title=f'album {i}', release_date='2020-01-01',
+               author=performers[i % len(performers)],
+               created_by=users[i % len(users)])
+         for i in range(rows // 10)),
+        batch_size=5000
+    )
+    track_ids = list(Track.objects.values_list('id', flat=True))
+    album_ids = list(Album.objects.values_list('id', flat=True))
+    FavoriteTrack.objects.bulk_create(
+        (FavoriteTrack(user=user, track_id=track_id)
+         for user in users
+         for track_id in random.sample(track_ids, min(len(track_ids), 200))),
+        batch_size=5000
+    )
+    FavoriteAlbum.objects.bulk_create(
+        (FavoriteAlbum(user=user, album_id=album_id)
+         for user in users
+         for album_id in random.sample(album_ids, min(len(album_ids), 50))),
+        batch_size=5000
+    )
+
+
+def lookups():
+    from music.models import (Album, FavoriteAlbum, FavoriteTrack,
+                              Performer, Track)
+    from users.models import User
+
+    user = User.objects.order_by('?').first()
+    performer = Performer.objects.order_by('?').first()
+    track = Track.objects.filter(author=performer).first()
+    album = Album.objects.filter(author=performer).first()
+    return {
+        'track (title, author)': lambda: Track.objects.filter(
+            title=track.title, author=performer
+        ).exists(),
+        'album (title, author)': lambda: Album.objects.filter(
+            title=album.title, author=performer
+        ).exists(),
+        'favorite (user, track)': lambda: FavoriteTrack.objects.filter(
+            user=user, track=track
+        ).exists(),
+        'favorite (user, album)': lambda: FavoriteAlbum.objects.filter(
+            user=user, album=album
+        ).exists(),
+    }
+
+
+def constraints():
+    from music.models import (Album, FavoriteAlbum, FavoritePlaylist,
+                              FavoriteTrack, Track)
+
+    for model in (Track, Album, FavoriteTrack, FavoriteAlbum,
+                  FavoritePlaylist):
+        for constraint in model._meta.constraints:
+            yield model, constraint
+
+
+def run(rows, repeat):
+    with test_database() as connection:
+        seed(rows)
+        checks = lookups()
+        with connection.schema_editor() as editor:
+            for model, constraint in constraints():
+                editor.remove_constraint(model, constraint)
+        before = {name: summary(measure(check, repeat))
+                  for name, check in checks.items()}
+        with connection.schema_editor() as editor:
+            for model, constraint in constraints():
+                editor.add_constraint(model, constraint)
+        after = {name: summary(measure(check, repeat))
+                 for name, check in checks.items()}
+
+    print(f'{"lookup":<26}{"before, ms":>12}{"after, ms":>12}')
+    for name in before:
+        print(f'{name:<26}{before[name]["mean_ms"]:>12.3f}'
+              f'{after[name]["mean_ms"]:>12.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    setup()
+    run(args.rows, args.repeat)
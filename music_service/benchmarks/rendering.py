@@ -0,0 +1,112 @@
+"""Скорость и память рендереров и парсеров на больших ответах API."""
+import argparse
+import io
+import tracemalloc
+
+from benchmarks import measure, setup, summary, test_database
+
+
+def seed(tracks, playlists, playlist_size):
+    from music.models import Performer, Playlist, PlaylistTrack, Track
+    from users.models import User
+
+    user = User.objects.create(username='bench', email='bench@example.com')
+    performers = Performer.objects.bulk_create(
+        Performer(name=f'Исполнитель {i}', created_by=user)
+        for i in range(max(tracks // 20, 1))
+    )
+    Track.objects.bulk_create(
+        (Track(title=f'Трек {i}', author=performers[i % len(performers)])
+         for i in range(tracks)),
+        batch_size=5000
+    )
+    track_ids = list(Track.objects.values_list('id', flat=True))
+    for i in range(playlists):
+        playlist = Playlist.objects.create(title=f'Плейлист {i}',
+                                           created_by=user)
+        start = i * playlist_size % len(track_ids)
+        PlaylistTrack.bulk_append(
+            playlist, track_ids[start:start + playlist_size]
+        )
+
+
+def payloads():
+    from api.serializers import PlaylistSerializer, TrackSerializer
+    from api.views import PlaylistViewSet, TrackViewSet
+
+    return {
+        'TrackSerializer': TrackSerializer(
+            TrackViewSet().get_queryset(), many=True
+        ).data,
+        'PlaylistSerializer': PlaylistSerializer(
+            PlaylistViewSet().get_queryset(), many=True
+        ).data,
+    }
+
+
+def codecs():
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from api import parsers, renderers
+
+    result = {'json': (JSONRenderer(), JSONParser())}
+    if renderers.orjson is not None:
+        result['orjson'] = (renderers.ORJSONRenderer(),
+                            parsers.ORJSONParser())
+    if renderers.msgpack is not None:
+        result['msgpack'] = (renderers.MessagePackRenderer(),
+                             parsers.MessagePackParser())
+    return result
+
+
+def peak_allocation(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(args):
+    with test_database():
+        seed(args.tracks, args.playlists, args.playlist_size)
+        data = payloads()
+
+    print(f'{"payload":<20}{"codec":<9}{"size, KB":>10}{"render, ms":>12}'
+          f'{"MB/s":>8}{"peak, KB":>10}{"parse, ms":>11}{"peak, KB":>10}')
+    for name, payload in data.items():
+        for codec, (renderer, parser) in codecs().items():
+            body = renderer.render(payload, renderer.media_type)
+            size = len(body)
+            render = summary(measure(
+                lambda: renderer.render(payload, renderer.media_type),
+                args.repeat
+            ))
+            parse = summary(measure(
+                lambda: parser.parse(io.BytesIO(body), parser.media_type),
+                args.repeat
+            ))
+            render_peak = peak_allocation(
+                lambda: renderer.render(payload, renderer.media_type)
+            )
+            parse_peak = peak_allocation(
+                lambda: parser.parse(io.BytesIO(body), parser.media_type)
+            )
+            throughput = size / render['mean_ms'] / 1000
+            print(f'{name:<20}{codec:<9}{size / 1024:>10.0f}'
+                  f'{render["mean_ms"]:>12.2f}{throughput:>8.0f}'
+                  f'{render_peak / 1024:>10.0f}{parse["mean_ms"]:>11.2f}'
+                  f'{parse_peak / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=20000)
+    parser.add_argument('--playlists', type=int, default=200)
+    parser.add_argument('--playlist-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    setup()
+    run(args)
@@ -0,0 +1,125 @@
+"""Скорость быстрого и обычного путей сериализации в строках в секунду.
+
+Совпадение ответов обоих путей проверяют тесты api.tests.FastReadTests.
+"""
+import argparse
+import datetime
+
+from benchmarks import measure, setup, summary, test_database
+
+CASES = (
+    ('tracks', ''),
+    ('tracks', 'fields=id,title'),
+    ('tracks', 'expand=playlists'),
+    ('tracks', 'fields=id,is_favorite&expand=albums'),
+    ('albums', ''),
+    ('albums', 'fields=id,release_date&expand=tracks'),
+    ('playlists', ''),
+    ('playlists', 'expand=tracks'),
+    ('performers', ''),
+    ('performers', 'fields=name&expand=albums'),
+)
+
+
+def seed(tracks):
+    from music.models import (Album, AlbumTrack, FavoriteAlbum,
+                              FavoritePlaylist, FavoriteTrack, Performer,
+                              Playlist, PlaylistTrack, Track)
+    from users.models import User
+
+    user = User.objects.create(username='bench', email='bench@example.com')
+    performers = Performer.objects.bulk_create(
+        Performer(name=f'Исполнитель {i}', created_by=user)
+        for i in range(max(tracks // 20, 1))
+    )
+    Track.objects.bulk_create(
+        (Track(title=f'Трек {i}', author=performers[i % len(performers)])
+         for i in range(tracks)),
+        batch_size=5000
+    )
+    Album.objects.bulk_create(
+        Album(title=f'Альбом {i}', author=performer, created_by=user,
+              release_date=datetime.date(2000 + i % 20, 1, 1))
+        for i, performer in enumerate(performers)
+    )
+    albums = {album.author_id: album.id for album in Album.objects.all()}
+    track_rows = list(Track.objects.values_list('id', 'author_id'))
+    AlbumTrack.objects.bulk_create(
+        (AlbumTrack(album_id=albums[author_id], track_id=track_id)
+         for track_id, author_id in track_rows[::2]),
+        batch_size=5000
+    )
+    FavoriteTrack.objects.bulk_create(
+        FavoriteTrack(user=user, track_id=track_id)
+        for track_id, _ in track_rows[::7]
+    )
+    FavoriteAlbum.objects.bulk_create(
+        FavoriteAlbum(user=user, album_id=album_id)
+        for album_id in list(albums.values())[::3]
+    )
+    for i in range(max(tracks // 100, 1)):
+        playlist = Playlist.objects.create(
+            title=f'Плейлист {i}', created_by=user,
+            description=f'Описание {i}' if i % 2 else None
+        )
+        PlaylistTrack.bulk_append(
+            playlist, [track_id for track_id, _ in track_rows[i::37][:50]]
+        )
+        if i % 2:
+            FavoritePlaylist.objects.create(user=user, playlist=playlist)
+    return user
+
+
+def make_view(resource, query, user):
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from api.urls import router
+
+    viewset = next(viewset for prefix, viewset, _ in router.registry
+                   if prefix == resource)
+    request = APIRequestFactory().get(f'/api/{resource}/?{query}')
+    force_authenticate(request, user)
+    view = viewset(action_map={'get': 'list'}, args=(), kwargs={},
+                   format_kwarg=None)
+    view.request = view.initialize_request(request)
+    view.headers = {}
+    return view
+
+
+def serialize(view, objects, fast):
+    view.fast_read_actions = ('list',) if fast else ()
+    return view.get_serializer(objects, many=True).data
+
+
+def run(args):
+    results = []
+    with test_database():
+        user = seed(args.tracks)
+        for resource, query in CASES:
+            view = make_view(resource, query, user)
+            objects = list(view.get_queryset()[:args.rows])
+            timings = {
+                fast: summary(measure(
+                    lambda: serialize(view, objects, fast), args.repeat
+                ))['mean_ms']
+                for fast in (False, True)
+            }
+            results.append((resource, query, len(objects), timings))
+
+    print(f'{"case":<48}{"rows":>6}{"drf rows/s":>12}{"fast rows/s":>13}'
+          f'{"speedup":>9}')
+    for resource, query, rows, timings in results:
+        drf = rows / timings[False] * 1000
+        fast = rows / timings[True] * 1000
+        print(f'{resource + "?" + query:<48}{rows:>6}{drf:>12.0f}'
+              f'{fast:>13.0f}{fast / drf:>9.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tracks', type=int, default=5000)
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    setup()
+    run(args)
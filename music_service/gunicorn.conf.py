@@ -0,0 +1,18 @@
+"""Настройки gunicorn: число воркеров и потоков в каждом из них.
+
+Соединений с базой на воркер нужно столько же, сколько потоков, поэтому
+размер пула по умолчанию берётся из GUNICORN_THREADS.
+"""
+import os
+import shutil
+
+bind = '0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+
+
+def on_starting(server):
+    # Метрики прошлого запуска не должны попасть в счётчики нового.
+    directory = os.getenv('METRICS_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,101 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import local
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Счётчик, модель строк, которые он считает, и поле связи с владельцем.
+COUNTERS = (
+    ('Album', 'tracks_count', 'AlbumTrack', 'album'),
+    ('Playlist', 'tracks_count', 'PlaylistTrack', 'playlist'),
+    ('Performer', 'tracks_count', 'Track', 'author'),
+    ('Track', 'favorites_count', 'FavoriteTrack', 'track'),
+    ('Album', 'favorites_count', 'FavoriteAlbum', 'album'),
+    ('Playlist', 'favorites_count', 'FavoritePlaylist', 'playlist'),
+)
+
+_batch = local()
+
+
+def resolve_counters(apps):
+    for model_name, field, row_model_name, link in COUNTERS:
+        yield (apps.get_model('music', model_name), field,
+               apps.get_model('music', row_model_name), link)
+
+
+def change_counter(model, field, pk, delta):
+    """Атомарно меняет счётчик, не опуская его ниже нуля."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_counters(model, field, deltas):
+    """Меняет счётчики многих строк, по запросу на каждую величину."""
+    pks = defaultdict(list)
+    for pk, delta in deltas.items():
+        pks[delta].append(pk)
+    for delta in pks:
+        queryset = model.objects.filter(pk__in=pks[delta])
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**{field: F(field) + delta})
+
+
+def update_counter(model, field, pk, delta):
+    """Меняет счётчик сразу или, внутри batch_counters, при выходе из него."""
+    deltas = getattr(_batch, 'deltas', None)
+    if deltas is None:
+        change_counter(model, field, pk, delta)
+    else:
+        deltas[model, field][pk] += delta
+
+
+@contextmanager
+def batch_counters():
+    """Копит изменения счётчиков и применяет их разом при выходе из блока.
+
+    Удаление пачки строк queryset.delete() шлёт post_delete на каждую,
+    и без этого блока каждая меняет счётчик отдельным запросом.
+    """
+    if getattr(_batch, 'deltas', None) is not None:
+        yield
+        return
+    _batch.deltas = defaultdict(Counter)
+    try:
+        yield
+        deltas = _batch.deltas
+    finally:
+        _batch.deltas = None
+    for (model, field), changes in deltas.items():
+        change_counters(model, field, {
+            pk: delta for pk, delta in changes.items() if delta
+        })
+
+
+def actual_count(row_model, link):
+    return Coalesce(Subquery(
+        row_model.objects.filter(**{link: OuterRef('pk')}).order_by().values(
+            link
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def reconcile_counter(model, field, row_model, link, batch_size=10000):
+    """Пересчитывает разошедшиеся счётчики пачками по диапазонам id.
+
+    Возвращает число исправленных строк.
+    """
+    ids = model.objects.order_by('pk').values_list('pk', flat=True)
+    first, last = ids.first(), ids.last()
+    if first is None:
+        return 0
+    fixed = 0
+    for start in range(first, last + 1, batch_size):
+        actual = actual_count(row_model, link)
+        fixed += model.objects.filter(
+            pk__gte=start, pk__lt=start + batch_size
+        ).exclude(**{field: actual}).update(**{field: actual})
+    return fixed
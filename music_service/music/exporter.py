@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .importer import batches
+from .models import Album, AlbumTrack, Performer, PlaylistTrack, Track
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Выборка, колонки выгрузки с полями, из которых они берутся, и порядок
+# строк. Колонки совпадают с теми, что понимает import_catalog.
+EXPORTS = {
+    'performers': (Performer.objects.all(), {
+        'id': 'id',
+        'name': 'name',
+    }, ('id',)),
+    'albums': (Album.objects.all(), {
+        'id': 'id',
+        'title': 'title',
+        'author_id': 'author_id',
+        'author': 'author__name',
+        'release_date': 'release_date',
+    }, ('id',)),
+    'tracks': (Track.objects.all(), {
+        'id': 'id',
+        'title': 'title',
+        'author_id': 'author_id',
+        'author': 'author__name',
+    }, ('id',)),
+    'album_tracks': (AlbumTrack.objects.all(), {
+        'album_id': 'album_id',
+        'album': 'album__title',
+        'author': 'album__author__name',
+        'track_id': 'track_id',
+        'track': 'track__title',
+        'track_author': 'track__author__name',
+    }, ('id',)),
+    # Номер трека — его позиция в плейлисте с 1, как в API, а не
+    # разреженный ключ сортировки из колонки track_number.
+    'playlist_tracks': (PlaylistTrack.objects.with_position(), {
+        'playlist': 'playlist_id',
+        'track_id': 'track_id',
+        'track': 'track__title',
+        'author': 'track__author__name',
+        'track_number': 'position',
+    }, ('playlist_id', 'track_number')),
+}
+
+
+def render_csv(columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def render_jsonl(columns, rows):
+    return ''.join(
+        json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder,
+                   ensure_ascii=False) + '\n'
+        for row in rows
+    )
+
+
+RENDERERS = {'csv': render_csv, 'jsonl': render_jsonl}
+
+
+def export_chunks(kind, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Выгрузка кусками текста, по куску на chunk_size строк.
+
+    Строки читаются курсором пачками, поэтому память не зависит от
+    размера таблицы.
+    """
+    queryset, columns, ordering = EXPORTS[kind]
+    render = RENDERERS[file_format]
+    if file_format == 'csv':
+        yield render(columns, [tuple(columns)])
+    rows = queryset.order_by(*ordering).values_list(
+        *columns.values()
+    ).iterator(chunk_size=chunk_size)
+    for batch in batches(rows, chunk_size):
+        yield render(columns, batch)
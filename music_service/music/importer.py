@@ -0,0 +1,291 @@
+import csv
+import datetime
+import json
+import os
+from collections import Counter
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from .counters import change_counters
+from .models import (Album, AlbumTrack, Performer, Playlist, PlaylistTrack,
+                     Track)
+from .signals import bulk_created
+
+FORMATS = ('csv', 'jsonl')
+KINDS = ('performers', 'albums', 'tracks', 'album_tracks', 'playlist_tracks')
+MAX_LENGTH = 128
+# Сколько ключей сверяется одним запросом: SQLite ограничивает глубину
+# выражения, а условие по ключам — цепочка OR.
+FIND_CHUNK_SIZE = 500
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def read_rows(path, format):
+    """Строки файла словарями вместе с их номерами в файле."""
+    with open(path, newline='', encoding='utf-8') as file:
+        if format == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_checkpoint(path, kind):
+    """Сколько строк файла уже загружено прошлым запуском."""
+    try:
+        with open(path, encoding='utf-8') as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return 0
+    if checkpoint['kind'] != kind:
+        raise ValueError(
+            f'Файл прогресса {path} относится к загрузке {checkpoint["kind"]}'
+        )
+    return checkpoint['rows']
+
+
+def write_checkpoint(path, kind, rows):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump({'kind': kind, 'rows': rows}, file)
+    os.replace(temporary, path)
+
+
+def text(row, name):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        raise RowError(f'не заполнено поле {name}')
+    if len(value) > MAX_LENGTH:
+        raise RowError(f'поле {name} длиннее {MAX_LENGTH} символов')
+    return value
+
+
+def find(model, keys, fields):
+    """id строк модели с данными значениями полей: {ключ: id}.
+
+    Условие строится по всему ключу, чтобы база искала строки по
+    уникальному индексу, а не выбирала все строки с тем же первым полем.
+    """
+    found = {}
+    for chunk in batches(keys, FIND_CHUNK_SIZE):
+        rows = model.objects.filter(reduce(or_, (
+            Q(**dict(zip(fields, key))) for key in chunk
+        ))).values_list(*fields, 'pk')
+        found.update((row[:-1], row[-1]) for row in rows)
+    return found
+
+
+class CatalogImporter:
+    """Загружает строки каталога пачками, пропуская уже существующие.
+
+    Исполнители ищутся по имени в словаре, загруженном один раз; альбомы,
+    треки и связи сверяются с базой по составному ключу, запросом на
+    каждые FIND_CHUNK_SIZE ключей пачки. Строки
+    вставляются через bulk_create, счётчики обновляются по пачке целиком,
+    а о вставленных строках сообщает сигнал bulk_created.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.performers = {}
+        rows = Performer.objects.order_by('-pk').values_list('name', 'pk')
+        for name, pk in rows.iterator():
+            self.performers[name] = pk
+        self.errors = []
+
+    def import_batch(self, kind, rows):
+        """Загружает пачку; возвращает число новых строк и ошибки строк."""
+        self.errors = []
+        clean = getattr(self, f'clean_{kind}')
+        cleaned = []
+        for line_number, row in rows:
+            try:
+                if not isinstance(row, dict):
+                    raise RowError('строка не разобрана')
+                cleaned.append((line_number, clean(row)))
+            except RowError as exc:
+                self.errors.append((line_number, str(exc)))
+        with transaction.atomic():
+            inserted = getattr(self, f'insert_{kind}')(cleaned)
+        return inserted, sorted(self.errors)
+
+    def performer(self, row, name):
+        author = text(row, name)
+        try:
+            return self.performers[author]
+        except KeyError:
+            raise RowError(f'исполнитель «{author}» не найден')
+
+    def create(self, model, objects, fields):
+        """Вставляет объекты, которых ещё нет в базе.
+
+        Возвращает {ключ: id} только вставленных строк: уже существовавшие
+        не считаются, даже если bulk_create молча пропустил их конфликт.
+        """
+        objects = {
+            tuple(getattr(obj, field) for field in fields): obj
+            for obj in objects
+        }
+        found = find(model, objects.keys(), fields)
+        model.objects.bulk_create([
+            obj for key, obj in objects.items() if key not in found
+        ], ignore_conflicts=True)
+        created = find(model, objects.keys() - found.keys(), fields)
+        if created:
+            bulk_created.send(sender=model, pks=list(created.values()))
+        return created
+
+    def missing(self, line_number, what, key):
+        self.errors.append((line_number, f'{what} «{key[0]}» не найден'))
+
+    def clean_performers(self, row):
+        return text(row, 'name')
+
+    def insert_performers(self, rows):
+        names = {
+            (name,): None for _, name in rows if name not in self.performers
+        }
+        # Исполнителей могла добавить загрузка, идущая параллельно.
+        self.performers.update(
+            (name, pk)
+            for (name,), pk in find(Performer, names, ('name',)).items()
+        )
+        names = [name for name, in names if name not in self.performers]
+        created = self.create(Performer, [
+            Performer(name=name, created_by=self.user) for name in names
+        ], ('name',))
+        self.performers.update(
+            (name, pk) for (name,), pk in created.items()
+        )
+        return len(created)
+
+    def clean_albums(self, row):
+        try:
+            release_date = datetime.date.fromisoformat(
+                text(row, 'release_date')
+            )
+        except ValueError:
+            raise RowError('дата release_date не в формате ГГГГ-ММ-ДД')
+        return (text(row, 'title'), self.performer(row, 'author'),
+                release_date)
+
+    def insert_albums(self, rows):
+        albums = {}
+        for _, (title, author_id, release_date) in rows:
+            albums.setdefault((title, author_id), release_date)
+        created = self.create(Album, [
+            Album(title=title, author_id=author_id,
+                  release_date=release_date, created_by=self.user)
+            for (title, author_id), release_date in albums.items()
+        ], ('title', 'author_id'))
+        return len(created)
+
+    def clean_tracks(self, row):
+        return text(row, 'title'), self.performer(row, 'author')
+
+    def insert_tracks(self, rows):
+        tracks = {key: None for _, key in rows}
+        created = self.create(Track, [
+            Track(title=title, author_id=author_id)
+            for title, author_id in tracks
+        ], ('title', 'author_id'))
+        change_counters(Performer, 'tracks_count', Counter(
+            author_id for _, author_id in created
+        ))
+        return len(created)
+
+    def clean_album_tracks(self, row):
+        album = text(row, 'album'), self.performer(row, 'author')
+        track_author = 'track_author' if row.get('track_author') else 'author'
+        return album, (text(row, 'track'), self.performer(row, track_author))
+
+    def insert_album_tracks(self, rows):
+        albums = find(Album, {album for _, (album, _) in rows},
+                      ('title', 'author_id'))
+        tracks = find(Track, {track for _, (_, track) in rows},
+                      ('title', 'author_id'))
+        pairs = {}
+        for line_number, (album, track) in rows:
+            if album not in albums:
+                self.missing(line_number, 'альбом', album)
+            elif track not in tracks:
+                self.missing(line_number, 'трек', track)
+            else:
+                pairs[(albums[album], tracks[track])] = None
+        created = self.create(AlbumTrack, [
+            AlbumTrack(album_id=album_id, track_id=track_id)
+            for album_id, track_id in pairs
+        ], ('album_id', 'track_id'))
+        change_counters(Album, 'tracks_count', Counter(
+            album_id for album_id, _ in created
+        ))
+        return len(created)
+
+    def clean_playlist_tracks(self, row):
+        try:
+            playlist_id = int(text(row, 'playlist'))
+        except ValueError:
+            raise RowError('поле playlist должно быть id плейлиста')
+        return playlist_id, (text(row, 'track'),
+                             self.performer(row, 'author'))
+
+    def insert_playlist_tracks(self, rows):
+        playlists = set(Playlist.objects.filter(
+            pk__in={playlist_id for _, (playlist_id, _) in rows}
+        ).values_list('pk', flat=True))
+        tracks = find(Track, {track for _, (_, track) in rows},
+                      ('title', 'author_id'))
+        appended = {}
+        for line_number, (playlist_id, track) in rows:
+            if playlist_id not in playlists:
+                self.missing(line_number, 'плейлист', (playlist_id,))
+            elif track not in tracks:
+                self.missing(line_number, 'трек', track)
+            else:
+                appended.setdefault(playlist_id, {})[tracks[track]] = None
+        pairs = {
+            (playlist_id, track_id)
+            for playlist_id, track_ids in appended.items()
+            for track_id in track_ids
+        }
+        found = find(PlaylistTrack, pairs, ('playlist_id', 'track_id'))
+        for playlist_id, track_ids in appended.items():
+            PlaylistTrack.bulk_append(Playlist(pk=playlist_id), [
+                track_id for track_id in track_ids
+                if (playlist_id, track_id) not in found
+            ])
+        created = find(PlaylistTrack, pairs - found.keys(),
+                       ('playlist_id', 'track_id'))
+        if created:
+            bulk_created.send(sender=PlaylistTrack,
+                              pks=list(created.values()))
+        return len(created)
@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music.exporter import (EXPORT_CHUNK_SIZE, EXPORTS, RENDERERS,
+                            export_chunks)
+
+
+class Command(BaseCommand):
+    help = 'Выгружает каталог в файлы CSV или JSONL, по файлу на вид'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kinds', nargs='*', metavar='kind',
+            help=f'Что выгружать: {", ".join(EXPORTS)}; по умолчанию всё',
+        )
+        parser.add_argument('--format', choices=RENDERERS, default='jsonl')
+        parser.add_argument(
+            '--output-dir', default='.',
+            help='Каталог, в который пишутся файлы <вид>.<формат>',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help='Сколько строк читать из базы за раз',
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(EXPORTS)
+        if unknown:
+            raise CommandError(f'Неизвестные виды: {", ".join(unknown)}')
+        os.makedirs(options['output_dir'], exist_ok=True)
+        for kind in options['kinds'] or EXPORTS:
+            path = os.path.join(options['output_dir'],
+                                f'{kind}.{options["format"]}')
+            temporary = f'{path}.tmp'
+            with open(temporary, 'w', encoding='utf-8', newline='') as file:
+                for chunk in export_chunks(kind, options['format'],
+                                           options['chunk_size']):
+                    file.write(chunk)
+            os.replace(temporary, path)
+            self.stdout.write(f'{kind}: {path}')
@@ -0,0 +1,100 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music.importer import (FORMATS, KINDS, CatalogImporter, batches,
+                            detect_format, read_checkpoint, read_rows,
+                            write_checkpoint)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Загружает каталог из CSV или JSONL, пропуская уже существующее'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind', choices=KINDS,
+            help='Что загружается: исполнители, альбомы, треки или связи '
+                 'альбомов и плейлистов с треками',
+        )
+        parser.add_argument('path', help='Файл CSV или JSONL')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, если его не видно по расширению',
+        )
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя, от которого создаются исполнители '
+                 'и альбомы',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк вставлять одной транзакцией',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл прогресса; по умолчанию <path>.checkpoint',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала файла, не глядя на сохранённый прогресс',
+        )
+
+    def handle(self, *args, **options):
+        kind, path = options['kind'], options['path']
+        file_format = options['format'] or detect_format(path)
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        user = None
+        if kind in ('performers', 'albums'):
+            if not options['user']:
+                raise CommandError('Для исполнителей и альбомов нужен --user')
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(
+                    f'Пользователь {options["user"]} не найден'
+                )
+
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        done = 0
+        if not options['restart']:
+            try:
+                done = read_checkpoint(checkpoint, kind)
+            except ValueError as exc:
+                raise CommandError(exc)
+        if done:
+            self.stdout.write(f'Продолжение с {done + 1}-й строки')
+
+        importer = CatalogImporter(user)
+        try:
+            rows = islice(read_rows(path, file_format), done, None)
+            started = time.monotonic()
+            processed = inserted = failed = 0
+            for batch in batches(rows, options['batch_size']):
+                batch_inserted, errors = importer.import_batch(kind, batch)
+                for line_number, message in errors:
+                    self.stderr.write(f'{path}:{line_number}: {message}')
+                processed += len(batch)
+                inserted += batch_inserted
+                failed += len(errors)
+                write_checkpoint(checkpoint, kind, done + processed)
+                rate = processed / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'Обработано строк: {done + processed}, добавлено: '
+                    f'{inserted}, с ошибками: {failed}, {rate:.0f} строк/с'
+                )
+        except FileNotFoundError:
+            raise CommandError(f'Файл {path} не найден')
+        except UnicodeDecodeError:
+            raise CommandError(f'Файл {path} не в кодировке UTF-8')
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка {kind} завершена: добавлено {inserted}, '
+            f'пропущено с ошибками {failed}'
+        ))
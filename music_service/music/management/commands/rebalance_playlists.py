@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+
+from music.models import TRACK_NUMBER_STEP, Playlist, PlaylistTrack
+
+
+class Command(BaseCommand):
+    help = 'Разрежает номера треков в плейлистах, где между ними мало места'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-gap', type=int, default=TRACK_NUMBER_STEP // 64,
+            help='Минимальный допустимый промежуток между номерами треков',
+        )
+
+    def handle(self, *args, **options):
+        gaps = PlaylistTrack.objects.annotate(
+            gap=F('track_number') - Window(
+                expression=Lag('track_number', default=0),
+                partition_by=[F('playlist_id')],
+                order_by=F('track_number').asc(),
+            )
+        ).values('playlist_id', 'gap')
+        crowded = set()
+        for row in gaps.iterator():
+            if row['gap'] < options['min_gap']:
+                crowded.add(row['playlist_id'])
+
+        for playlist_id in sorted(crowded):
+            with transaction.atomic():
+                playlist = Playlist.objects.select_for_update().get(
+                    pk=playlist_id
+                )
+                playlist.rebalance_track_numbers()
+        self.stdout.write(f'Перенумеровано плейлистов: {len(crowded)}')
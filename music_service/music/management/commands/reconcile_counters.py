@@ -0,0 +1,24 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from music.counters import reconcile_counter, resolve_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики треков и избранного, если они разошлись'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Сколько строк пересчитывать одним запросом',
+        )
+
+    def handle(self, *args, **options):
+        for model, field, row_model, link in resolve_counters(apps):
+            with transaction.atomic():
+                fixed = reconcile_counter(model, field, row_model, link,
+                                          batch_size=options['batch_size'])
+            self.stdout.write(
+                f'{model.__name__}.{field}: исправлено строк {fixed}'
+            )
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from music.seeding import CatalogSeeder
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическим каталогом для нагрузочных проверок'
+
+    def add_arguments(self, parser):
+        for name, default, help_text in (
+            ('users', 100, 'Сколько создать пользователей'),
+            ('performers', 1000, 'Сколько создать исполнителей'),
+            ('albums', 3000, 'Сколько создать альбомов'),
+            ('tracks', 30000, 'Сколько создать треков'),
+            ('playlists', 1000, 'Сколько создать плейлистов'),
+            ('favorites', 50,
+             'Сколько треков в среднем добавляет в избранное пользователь'),
+        ):
+            parser.add_argument(f'--{name}', type=int, default=default,
+                                help=help_text)
+        parser.add_argument(
+            '--seed', type=int,
+            help='Зерно генератора, чтобы повторить тот же каталог '
+                 '(в другой базе: имена пользователей тоже совпадут)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк вставлять одним запросом',
+        )
+
+    def handle(self, *args, **options):
+        counts = {
+            name: options[name]
+            for name in ('users', 'performers', 'albums', 'tracks',
+                         'playlists', 'favorites')
+        }
+        if min(counts.values()) < 0 or options['batch_size'] < 1:
+            raise CommandError('Количества не могут быть отрицательными')
+        if counts['users'] < 1 or counts['performers'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и исполнитель')
+
+        seeder = CatalogSeeder(options['seed'], options['batch_size'])
+        with transaction.atomic():
+            created = seeder.seed(**counts)
+        for name, count in created.items():
+            self.stdout.write(f'{name}: {count}')
@@ -0,0 +1,62 @@
+# Generated by Django 4.1.7 on 2026-10-18 01:27
+
+from django.db import migrations, models
+
+TRACK_NUMBER_STEP = 1024
+
+
+def spread_track_numbers(apps, schema_editor):
+    Playlist = apps.get_model('music', 'Playlist')
+    PlaylistTrack = apps.get_model('music', 'PlaylistTrack')
+    for playlist in Playlist.objects.iterator():
+        playlist_tracks = list(
+            PlaylistTrack.objects.filter(
+                playlist=playlist
+            ).order_by('track_number', 'id')
+        )
+        for i, playlist_track in enumerate(playlist_tracks, 1):
+            playlist_track.track_number = i * TRACK_NUMBER_STEP
+        PlaylistTrack.objects.bulk_update(playlist_tracks, ['track_number'],
+                                          batch_size=1000)
+        playlist.last_track_number = len(playlist_tracks) * TRACK_NUMBER_STEP
+        playlist.save(update_fields=['last_track_number'])
+
+
+def compact_track_numbers(apps, schema_editor):
+    Playlist = apps.get_model('music', 'Playlist')
+    PlaylistTrack = apps.get_model('music', 'PlaylistTrack')
+    for playlist in Playlist.objects.iterator():
+        playlist_tracks = list(
+            PlaylistTrack.objects.filter(
+                playlist=playlist
+            ).order_by('track_number', 'id')
+        )
+        for i, playlist_track in enumerate(playlist_tracks, 1):
+            playlist_track.track_number = i
+        PlaylistTrack.objects.bulk_update(playlist_tracks, ['track_number'],
+                                          batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_favoritetrack_favoriteplaylist_favoritealbum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='last_track_number',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='playlisttrack',
+            name='track_number',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.RunPython(spread_track_numbers, compact_track_numbers),
+        migrations.AddIndex(
+            model_name='playlisttrack',
+            index=models.Index(fields=['playlist', 'track_number'], name='playlist_track_number_idx'),
+        ),
+    ]
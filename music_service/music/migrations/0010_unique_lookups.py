@@ -0,0 +1,63 @@
+# Generated by Django 4.1.7 on 2026-10-18 01:33
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name, field in (('FavoriteTrack', 'track'),
+                              ('FavoriteAlbum', 'album'),
+                              ('FavoritePlaylist', 'playlist')):
+        model = apps.get_model('music', model_name)
+        duplicates = model.objects.values('user', field).annotate(
+            first_id=Min('id'), rows=Count('id')
+        ).filter(rows__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(
+                user=duplicate['user'], **{field: duplicate[field]}
+            ).exclude(id=duplicate['first_id']).delete()
+
+    for model_name in ('Track', 'Album'):
+        model = apps.get_model('music', model_name)
+        duplicates = model.objects.values('title', 'author').annotate(
+            first_id=Min('id'), rows=Count('id')
+        ).filter(rows__gt=1)
+        for duplicate in duplicates:
+            renamed = model.objects.filter(
+                title=duplicate['title'], author=duplicate['author']
+            ).exclude(id=duplicate['first_id'])
+            for obj in renamed:
+                suffix = f' ({obj.id})'
+                obj.title = obj.title[:128 - len(suffix)] + suffix
+                obj.save(update_fields=['title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_playlist_last_track_number_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='album',
+            constraint=models.UniqueConstraint(fields=('title', 'author'), name='unique_album_title_author'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoritealbum',
+            constraint=models.UniqueConstraint(fields=('user', 'album'), name='unique_favorite_album'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoriteplaylist',
+            constraint=models.UniqueConstraint(fields=('user', 'playlist'), name='unique_favorite_playlist'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoritetrack',
+            constraint=models.UniqueConstraint(fields=('user', 'track'), name='unique_favorite_track'),
+        ),
+        migrations.AddConstraint(
+            model_name='track',
+            constraint=models.UniqueConstraint(fields=('title', 'author'), name='unique_track_title_author'),
+        ),
+    ]
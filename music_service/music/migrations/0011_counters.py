@@ -0,0 +1,78 @@
+# Generated by Django 4.1.7 on 2026-10-18 01:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Счётчик, модель строк, которые он считает, и поле связи с владельцем.
+COUNTERS = (
+    ('Album', 'tracks_count', 'AlbumTrack', 'album'),
+    ('Playlist', 'tracks_count', 'PlaylistTrack', 'playlist'),
+    ('Performer', 'tracks_count', 'Track', 'author'),
+    ('Track', 'favorites_count', 'FavoriteTrack', 'track'),
+    ('Album', 'favorites_count', 'FavoriteAlbum', 'album'),
+    ('Playlist', 'favorites_count', 'FavoritePlaylist', 'playlist'),
+)
+BATCH_SIZE = 10000
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, row_model_name, link in COUNTERS:
+        model = apps.get_model('music', model_name)
+        row_model = apps.get_model('music', row_model_name)
+        ids = model.objects.order_by('pk').values_list('pk', flat=True)
+        first, last = ids.first(), ids.last()
+        if first is None:
+            continue
+        for start in range(first, last + 1, BATCH_SIZE):
+            actual = Coalesce(Subquery(
+                row_model.objects.filter(
+                    **{link: OuterRef('pk')}
+                ).order_by().values(link).annotate(
+                    total=Count('pk')
+                ).values('total')
+            ), 0)
+            model.objects.filter(
+                pk__gte=start, pk__lt=start + BATCH_SIZE
+            ).update(**{field: actual})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0010_unique_lookups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='tracks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='performer',
+            name='tracks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='tracks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber
 
 from users.models import User
 
+from .counters import change_counter
+
+TRACK_NUMBER_STEP = 1024
+
 
 class Performer(models.Model):
     name = models.CharField(max_length=128)
@@ -9,6 +15,9 @@ class Performer(models.Model):
         User,
         on_delete=models.CASCADE
     )
+    tracks_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return self.name
@@ -28,10 +37,79 @@ class Playlist(models.Model):
         User,
         on_delete=models.CASCADE
     )
+    last_track_number = models.PositiveBigIntegerField(default=0)
+    tracks_count = models.PositiveIntegerField(default=0, editable=False)
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return self.title
 
+    def reserve_track_numbers(self, count):
+        """Резервирует count номеров в конце плейлиста.
+
+        UPDATE блокирует строку плейлиста до конца транзакции, поэтому
+        параллельные добавления получают непересекающиеся номера.
+        Возвращает последний зарезервированный номер.
+        """
+        step = count * TRACK_NUMBER_STEP
+        Playlist.objects.filter(pk=self.pk).update(
+            last_track_number=F('last_track_number') + step
+        )
+        return Playlist.objects.filter(pk=self.pk).values_list(
+            'last_track_number', flat=True
+        ).get()
+
+    def move_track(self, playlist_track, position):
+        """Переносит трек на позицию position, меняя только его строку.
+
+        Новый номер берётся посередине между соседями; если места между
+        ними не осталось, номера плейлиста сначала разрежаются заново.
+        Вызывать внутри транзакции с заблокированной строкой плейлиста.
+        """
+        others = PlaylistTrack.objects.filter(playlist=self).exclude(
+            pk=playlist_track.pk
+        ).order_by('track_number').values_list('track_number', flat=True)
+        if position <= 1:
+            lower = 0
+            upper = others.first()
+        else:
+            neighbours = list(others[position - 2:position])
+            if not neighbours:
+                neighbours = [others.last()]
+            lower = neighbours[0] or 0
+            upper = neighbours[1] if len(neighbours) > 1 else None
+
+        if upper is None:
+            track_number = self.reserve_track_numbers(1)
+        elif upper - lower > 1:
+            track_number = (lower + upper) // 2
+        else:
+            self.rebalance_track_numbers()
+            return self.move_track(playlist_track, position)
+
+        playlist_track.track_number = track_number
+        PlaylistTrack.objects.filter(pk=playlist_track.pk).update(
+            track_number=track_number
+        )
+        return playlist_track
+
+    def rebalance_track_numbers(self):
+        playlist_tracks = list(
+            PlaylistTrack.objects.filter(playlist=self).order_by(
+                'track_number', 'id'
+            ).only('id', 'track_number')
+        )
+        for i, playlist_track in enumerate(playlist_tracks, 1):
+            playlist_track.track_number = i * TRACK_NUMBER_STEP
+        PlaylistTrack.objects.bulk_update(playlist_tracks, ['track_number'],
+                                          batch_size=1000)
+        self.last_track_number = len(playlist_tracks) * TRACK_NUMBER_STEP
+        Playlist.objects.filter(pk=self.pk).update(
+            last_track_number=self.last_track_number
+        )
+
 
 class Album(models.Model):
     title = models.CharField(
@@ -46,6 +124,18 @@ class Album(models.Model):
         User,
         on_delete=models.CASCADE
     )
+    tracks_count = models.PositiveIntegerField(default=0, editable=False)
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['title', 'author'],
+                name='unique_album_title_author',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -68,11 +158,45 @@ class Track(models.Model):
         through='AlbumTrack',
         related_name='tracks'
     )
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['title', 'author'],
+                name='unique_track_title_author',
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class PlaylistTrackQuerySet(models.QuerySet):
+
+    def with_position(self):
+        """Порядковый номер трека; для выборок целых плейлистов."""
+        return self.annotate(
+            position=Window(
+                expression=RowNumber(),
+                partition_by=[F('playlist_id')],
+                order_by=F('track_number').asc(),
+            )
+        ).order_by('playlist_id', 'track_number')
+
+    def with_position_lookup(self):
+        """Порядковый номер трека; для выборок отдельных строк."""
+        preceding = PlaylistTrack.objects.filter(
+            playlist_id=OuterRef('playlist_id'),
+            track_number__lte=OuterRef('track_number'),
+        ).order_by().values('playlist_id').annotate(
+            position=Count('pk')
+        ).values('position')
+        return self.annotate(position=Subquery(preceding))
+
+
 class PlaylistTrack(models.Model):
     playlist = models.ForeignKey(
         Playlist,
@@ -82,7 +206,9 @@ class PlaylistTrack(models.Model):
         Track,
         on_delete=models.CASCADE
     )
-    track_number = models.PositiveIntegerField()
+    track_number = models.PositiveBigIntegerField()
+
+    objects = PlaylistTrackQuerySet.as_manager()
 
     class Meta:
         constraints = [
@@ -91,18 +217,41 @@ class PlaylistTrack(models.Model):
                 name='unique_playlist_title',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['playlist', 'track_number'],
+                name='playlist_track_number_idx',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.pk:
-            last_playlist_track = PlaylistTrack.objects.filter(
-                playlist=self.playlist
-            ).last()
-            track_number = (
-                last_playlist_track.track_number + 1 if last_playlist_track else 1
-            )
-            self.track_number = track_number
+            with transaction.atomic():
+                self.track_number = self.playlist.reserve_track_numbers(1)
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
+    @classmethod
+    def bulk_append(cls, playlist, track_ids):
+        track_ids = list(track_ids)
+        if not track_ids:
+            return []
+        with transaction.atomic():
+            last_track_number = playlist.reserve_track_numbers(len(track_ids))
+            first_track_number = (
+                last_track_number - (len(track_ids) - 1) * TRACK_NUMBER_STEP
+            )
+            playlist_tracks = cls.objects.bulk_create([
+                cls(playlist=playlist,
+                    track_id=track_id,
+                    track_number=first_track_number + i * TRACK_NUMBER_STEP)
+                for i, track_id in enumerate(track_ids)
+            ])
+            change_counter(Playlist, 'tracks_count', playlist.pk,
+                           len(playlist_tracks))
+            return playlist_tracks
+
 
 class AlbumTrack(models.Model):
     album = models.ForeignKey(
@@ -135,6 +284,14 @@ class FavoriteTrack(models.Model):
         related_name='favorite_tracks'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'track'],
+                name='unique_favorite_track',
+            ),
+        ]
+
     def __str__(self):
         return self.user
 
@@ -151,6 +308,14 @@ class FavoriteAlbum(models.Model):
         related_name='favorite_albums'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'album'],
+                name='unique_favorite_album',
+            ),
+        ]
+
     def __str__(self):
         return self.user
 
@@ -167,5 +332,13 @@ class FavoritePlaylist(models.Model):
         related_name='favorite_playlists'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'playlist'],
+                name='unique_favorite_playlist',
+            ),
+        ]
+
     def __str__(self):
         return self.user
@@ -0,0 +1,218 @@
+import datetime
+import random
+from collections import Counter
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+
+from users.models import User
+
+from .counters import change_counters
+from .importer import batches
+from .models import (TRACK_NUMBER_STEP, Album, AlbumTrack, FavoriteAlbum,
+                     FavoritePlaylist, FavoriteTrack, Performer, Playlist,
+                     PlaylistTrack, Track)
+
+WORDS = (
+    'night', 'city', 'love', 'fire', 'dream', 'river', 'summer', 'shadow',
+    'light', 'heart', 'storm', 'gold', 'silver', 'road', 'winter', 'echo',
+    'blue', 'wild', 'velvet', 'neon', 'ocean', 'glass', 'stone', 'rain',
+    'ночь', 'город', 'любовь', 'огонь', 'мечта', 'река', 'лето', 'тень',
+    'свет', 'сердце', 'буря', 'дорога', 'зима', 'эхо', 'небо', 'ветер',
+)
+ALBUM_SIZE = (6, 14)
+MAX_PLAYLIST_SIZE = 1000
+ZIPF_EXPONENT = 1.1
+
+
+def zipf_weights(count, rng):
+    """Накопленные веса Ципфа, случайно розданные count элементам."""
+    weights = [1 / rank ** ZIPF_EXPONENT for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+def weighted_sample(rng, population, cum_weights, size):
+    """До size разных элементов; популярные выпадают чаще."""
+    size = min(size, len(population))
+    chosen = {}
+    if size <= 0:
+        return []
+    for _ in range(3):
+        chosen.update(dict.fromkeys(rng.choices(
+            population, cum_weights=cum_weights, k=size - len(chosen)
+        )))
+        if len(chosen) >= size:
+            break
+    return list(chosen)
+
+
+class CatalogSeeder:
+    """Синтетический каталог с перекосом популярности, как в жизни.
+
+    Число треков у исполнителей, популярность треков, альбомов и
+    плейлистов и активность пользователей распределены по Ципфу, размеры
+    плейлистов — логнормально: немного хитов и длинный хвост.
+    """
+
+    def __init__(self, seed=None, batch_size=5000):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        # Префикс имён тоже из генератора: с тем же зерном каталог
+        # повторяется целиком, включая имена пользователей.
+        self.prefix = '%06x' % self.rng.getrandbits(24)
+
+    def create(self, model, objects):
+        """Вставляет объекты пачками; возвращает id новых строк по порядку."""
+        last = model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        for batch in batches(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+        return list(model.objects.filter(pk__gt=last).order_by(
+            'pk'
+        ).values_list('pk', flat=True))
+
+    def titles(self, count):
+        """count разных названий из случайных слов."""
+        titles = {}
+        while len(titles) < count:
+            title = ' '.join(
+                self.rng.sample(WORDS, self.rng.randint(1, 3))
+            ).capitalize()
+            if title in titles:
+                title = f'{title} {len(titles)}'
+            titles[title] = None
+        return list(titles)
+
+    def release_date(self):
+        return datetime.date(self.rng.randint(1960, 2023),
+                             self.rng.randint(1, 12), self.rng.randint(1, 28))
+
+    def seed(self, users, performers, albums, tracks, playlists, favorites):
+        """Создаёт каталог; возвращает число созданных строк по моделям."""
+        rng = self.rng
+        password = make_password(None)
+        user_ids = self.create(User, (
+            User(username=f'listener-{self.prefix}-{i}',
+                 email=f'listener-{self.prefix}-{i}@example.com',
+                 first_name='Слушатель', last_name=str(i), password=password)
+            for i in range(users)
+        ))
+        activity = zipf_weights(len(user_ids), rng)
+
+        performer_ids = self.create(Performer, (
+            Performer(name=name, created_by_id=rng.choice(user_ids))
+            for name in self.titles(performers)
+        ))
+        performer_tracks = Counter(rng.choices(
+            performer_ids, cum_weights=zipf_weights(len(performer_ids), rng),
+            k=tracks
+        ))
+        track_ids = self.create(Track, (
+            Track(title=title, author_id=performer_id)
+            for performer_id, count in performer_tracks.items()
+            for title in self.titles(count)
+        ))
+        discographies = {}
+        start = 0
+        for performer_id, count in performer_tracks.items():
+            discographies[performer_id] = track_ids[start:start + count]
+            start += count
+
+        album_plan = []
+        performer_albums = Counter(rng.choices(
+            list(performer_tracks), weights=list(performer_tracks.values()),
+            k=albums
+        ))
+        for performer_id, count in performer_albums.items():
+            free = discographies[performer_id]
+            for title in self.titles(count):
+                size = rng.randint(*ALBUM_SIZE)
+                album_plan.append((performer_id, title, free[:size]))
+                free = free[size:]
+        album_ids = self.create(Album, (
+            Album(title=title, author_id=performer_id,
+                  release_date=self.release_date(),
+                  created_by_id=rng.choice(user_ids))
+            for performer_id, title, _ in album_plan
+        ))
+        self.create(AlbumTrack, (
+            AlbumTrack(album_id=album_id, track_id=track_id)
+            for album_id, (_, _, members) in zip(album_ids, album_plan)
+            for track_id in members
+        ))
+        album_tracks = Counter({
+            album_id: len(members)
+            for album_id, (_, _, members) in zip(album_ids, album_plan)
+        })
+
+        popularity = zipf_weights(len(track_ids), rng)
+        playlist_plan = []
+        for owner_id in rng.choices(user_ids, cum_weights=activity,
+                                    k=playlists):
+            size = min(int(rng.lognormvariate(3, 1)) + 1, MAX_PLAYLIST_SIZE)
+            playlist_plan.append((owner_id, weighted_sample(
+                rng, track_ids, popularity, size
+            )))
+        playlist_ids = self.create(Playlist, (
+            Playlist(title=title, created_by_id=owner_id,
+                     description=title if rng.random() < 0.3 else None,
+                     last_track_number=len(members) * TRACK_NUMBER_STEP)
+            for (owner_id, members), title in zip(
+                playlist_plan, self.titles(len(playlist_plan))
+            )
+        ))
+        self.create(PlaylistTrack, (
+            PlaylistTrack(playlist_id=playlist_id, track_id=track_id,
+                          track_number=number * TRACK_NUMBER_STEP)
+            for playlist_id, (_, members) in zip(playlist_ids, playlist_plan)
+            for number, track_id in enumerate(members, 1)
+        ))
+        playlist_tracks = Counter({
+            playlist_id: len(members)
+            for playlist_id, (_, members) in zip(playlist_ids, playlist_plan)
+        })
+
+        favorite_counts = Counter(rng.choices(
+            user_ids, cum_weights=activity, k=users * favorites
+        ))
+        liked_counts = {
+            Track: Counter(), Album: Counter(), Playlist: Counter()
+        }
+        liked = (
+            (Track, FavoriteTrack, 'track_id', track_ids, popularity, 1),
+            (Album, FavoriteAlbum, 'album_id', album_ids,
+             zipf_weights(len(album_ids), rng), 5),
+            (Playlist, FavoritePlaylist, 'playlist_id', playlist_ids,
+             zipf_weights(len(playlist_ids), rng), 10),
+        )
+        for model, favorite_model, link, ids, weights, share in liked:
+            rows = [
+                (user_id, object_id)
+                for user_id, count in favorite_counts.items()
+                for object_id in weighted_sample(rng, ids, weights,
+                                                 count // share)
+            ]
+            self.create(favorite_model, (
+                favorite_model(user_id=user_id, **{link: object_id})
+                for user_id, object_id in rows
+            ))
+            liked_counts[model].update(object_id for _, object_id in rows)
+
+        change_counters(Performer, 'tracks_count', performer_tracks)
+        change_counters(Album, 'tracks_count', album_tracks)
+        change_counters(Playlist, 'tracks_count', playlist_tracks)
+        for model, counts in liked_counts.items():
+            change_counters(model, 'favorites_count', counts)
+        return {
+            'users': len(user_ids),
+            'performers': len(performer_ids),
+            'albums': len(album_ids),
+            'tracks': len(track_ids),
+            'album_tracks': sum(album_tracks.values()),
+            'playlists': len(playlist_ids),
+            'playlist_tracks': sum(playlist_tracks.values()),
+            'favorites': sum(sum(counts.values())
+                             for counts in liked_counts.values()),
+        }
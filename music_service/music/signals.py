@@ -0,0 +1,30 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+
+from .counters import resolve_counters, update_counter
+
+# Строки, вставленные пачкой в обход save(): sender — модель, pks — их id.
+bulk_created = Signal()
+
+
+def connect_counter(model, field, row_model, link):
+    link_id = row_model._meta.get_field(link).attname
+
+    def row_created(sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            update_counter(model, field, getattr(instance, link_id), 1)
+
+    def row_deleted(sender, instance, **kwargs):
+        update_counter(model, field, getattr(instance, link_id), -1)
+
+    uid = f'{model.__name__}.{field}'
+    post_save.connect(row_created, sender=row_model, weak=False,
+                      dispatch_uid=uid)
+    post_delete.connect(row_deleted, sender=row_model, weak=False,
+                        dispatch_uid=uid)
+
+
+def connect_counters():
+    for counter in resolve_counters(apps):
+        connect_counter(*counter)
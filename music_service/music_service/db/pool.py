@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import Counter
+
+from django.db import OperationalError
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """Открытые соединения процесса, которые переживают запрос.
+
+    Соединение берётся из пула вместо открытия нового и возвращается в
+    него вместо закрытия. Больше size соединений пул не открывает: поток
+    ждёт свободное до timeout секунд. Соединение, пролежавшее без дела
+    дольше check_after секунд, перед выдачей проверяется запросом SELECT 1.
+    """
+
+    def __init__(self, size=1, timeout=10.0, check_after=30.0):
+        self.size = size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.idle = []
+        self.opened = 0
+        self.condition = threading.Condition()
+        self.stats = Counter()
+
+    def acquire(self, connect):
+        with self.condition:
+            self.stats['checkouts'] += 1
+        while True:
+            connection, idle_since = self._take()
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self._forget()
+                    raise
+                with self.condition:
+                    self.stats['connects'] += 1
+                return connection
+            if (time.monotonic() - idle_since < self.check_after
+                    or self._is_alive(connection)):
+                return connection
+            self.discard(connection)
+
+    def _take(self):
+        """Свободное соединение или (None, None), если можно открыть новое."""
+        deadline = None
+        with self.condition:
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.opened < self.size:
+                    self.opened += 1
+                    return None, None
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.timeout
+                    self.stats['waits'] += 1
+                if now >= deadline:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'Нет свободного соединения с базой за '
+                        f'{self.timeout} с'
+                    )
+                self.condition.wait(deadline - now)
+
+    def release(self, connection):
+        try:
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self.condition:
+            self.stats['discarded'] += 1
+        self._forget()
+
+    def _forget(self):
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def close_idle(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+    @staticmethod
+    def _is_alive(connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'open': self.opened,
+                'idle': len(self.idle),
+                **self.stats,
+            }
+
+
+def get_pool(alias, settings_dict):
+    """Пул базы alias этого процесса: после fork у воркера свой пул.
+
+    Пул привязан и к имени базы, чтобы тестовая база, которую Django
+    подставляет в NAME, не получила соединений с рабочей.
+    """
+    key = (os.getpid(), alias, settings_dict['NAME'])
+    with _pools_lock:
+        if key not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[key] = ConnectionPool(
+                size=options.get('SIZE', 1),
+                timeout=options.get('TIMEOUT', 10.0),
+                check_after=options.get('CHECK_AFTER', 30.0),
+            )
+        return _pools[key]
+
+
+def pool_stats():
+    """Состояние пулов этого процесса по псевдонимам баз."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(alias, pool) for (owner, alias, _), pool in _pools.items()
+                 if owner == pid]
+    stats = {}
+    for alias, pool in pools:
+        stats.setdefault(alias, Counter()).update(pool.snapshot())
+    return stats
+
+
+def close_idle_connections(alias):
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for (owner, name, _), pool in _pools.items()
+                 if owner == pid and name == alias]
+    for pool in pools:
+        pool.close_idle()
+
+
+class PooledDatabaseWrapperMixin:
+    """Берёт соединения из пула процесса и возвращает их туда при закрытии.
+
+    Настройки пула — в ключе POOL настроек базы: SIZE, TIMEOUT и
+    CHECK_AFTER. Чтобы соединение возвращалось в пул после каждого
+    запроса, CONN_MAX_AGE должен быть 0.
+    """
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        self.pool = get_pool(self.alias, self.settings_dict)
+        return self.pool.acquire(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.in_atomic_block:
+            # Django оставит ссылку на соединение до отката: отдавать его
+            # другому потоку нельзя.
+            self.pool.discard(self.connection)
+        else:
+            self.pool.release(self.connection)
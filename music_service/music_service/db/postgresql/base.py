@@ -0,0 +1,14 @@
+from django.db.backends.postgresql import base, creation
+
+from ..pool import PooledDatabaseWrapperMixin, close_idle_connections
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Свободные соединения пула не дали бы удалить тестовую базу.
+        close_idle_connections(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    creation_class = DatabaseCreation
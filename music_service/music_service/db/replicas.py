@@ -0,0 +1,138 @@
+import random
+from contextlib import contextmanager
+from threading import local
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = local()
+
+
+@contextmanager
+def read_from(alias, request=None):
+    """Чтения в блоке идут в базу alias, пока в блоке ничего не записано.
+
+    С alias None, как и вне блока, все чтения идут в основную базу. Если
+    передан request, реплика выбрана для него лишь предварительно: до
+    аутентификации чтения идут в основную базу, а после неё реплика
+    отменяется, если пользователь недавно что-то записал.
+    """
+    previous = (getattr(_state, 'alias', None),
+                getattr(_state, 'wrote', False),
+                getattr(_state, 'request', None))
+    _state.alias, _state.wrote, _state.request = alias, False, request
+    try:
+        yield _state
+    finally:
+        _state.alias, _state.wrote, _state.request = previous
+
+
+@contextmanager
+def read_from_primary():
+    """Чтения в блоке идут в основную базу, даже если запрос читает реплику.
+
+    Так читается то, что кладётся в кэш: версии в кэше меняются сразу
+    после коммита, и данные из отставшей реплики остались бы в нём под
+    новой версией. Запись в блоке, как и без него, переводит чтения на
+    основную базу до конца read_from.
+    """
+    previous = getattr(_state, 'alias', None)
+    _state.alias = None
+    try:
+        yield
+    finally:
+        if not getattr(_state, 'wrote', False):
+            _state.alias = previous
+
+
+class ReplicaRouter:
+    """Читает из реплики, выбранной read_from, пишет в основную базу.
+
+    Первая же запись переводит чтения до конца блока на основную базу,
+    чтобы запрос видел то, что сам записал.
+    """
+
+    def db_for_read(self, model, **hints):
+        return current_alias() or 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.alias = None
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+def current_alias():
+    """Реплика для чтения или None, если читать нужно из основной базы."""
+    alias = getattr(_state, 'alias', None)
+    request = getattr(_state, 'request', None)
+    if alias is None or request is None:
+        return alias
+    user = authenticated_user(request)
+    if user is None:
+        return None
+    _state.request = None
+    if user.is_authenticated and cache.get(sticky_key(user.pk)):
+        _state.alias = None
+    return _state.alias
+
+
+def authenticated_user(request):
+    """Пользователь запроса, если аутентификация уже прошла, иначе None.
+
+    DRF аутентифицирует запрос во view и кладёт пользователя в request.user;
+    до этого там ленивый объект AuthenticationMiddleware или ничего.
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject):
+        return None
+    return user
+
+
+def sticky_key(user_id):
+    """Ключ кэша с отметкой, что пользователь недавно что-то записал."""
+    return f'replica:primary:{user_id}'
+
+
+class ReplicaMiddleware:
+    """Направляет чтения безопасных запросов в одну из реплик.
+
+    Пользователь, который что-то записал, ещё REPLICA_STICKY_SECONDS секунд
+    читает только из основной базы: реплика могла не успеть получить его
+    изменения. Пользователь узнаётся по id после аутентификации, поэтому
+    отметка не теряется, когда после входа меняются заголовки и cookie.
+    Потоковые ответы читают из той же базы, что и запрос.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        alias = None
+        if request.method in SAFE_METHODS:
+            alias = random.choice(settings.DATABASE_REPLICAS)
+        with read_from(alias, request) as state:
+            response = self.get_response(request)
+            wrote = state.wrote
+            alias = current_alias()
+        user = authenticated_user(request)
+        if wrote and user is not None and user.is_authenticated:
+            cache.set(sticky_key(user.pk), True,
+                      settings.REPLICA_STICKY_SECONDS)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, alias
+            )
+        return response
+
+    def stream(self, content, alias):
+        with read_from(alias):
+            yield from content
@@ -1,3 +1,4 @@
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
@@ -26,6 +27,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.MetricsMiddleware',
+    'api.querycount.QueryCountMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,16 +57,66 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'music_service.wsgi.application'
 
+DB_ENGINE = os.getenv('DB_ENGINE')
+# Движки music_service.db.* берут соединения из пула процесса и
+# возвращают их туда в конце каждого запроса, остальные держат одно
+# соединение на поток не дольше DB_CONN_MAX_AGE секунд.
+DB_POOLED = (DB_ENGINE or '').startswith('music_service.db.')
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE'),
+        'ENGINE': DB_ENGINE,
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', 0 if DB_POOLED else 60)
+        ),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'SIZE': int(os.getenv(
+                'DB_POOL_SIZE', os.getenv('GUNICORN_THREADS', 1)
+            )),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'CHECK_AFTER': float(os.getenv('DB_POOL_CHECK_AFTER', 30)),
+        },
+    }
+}
+
+# Реплики для чтения через запятую: адреса серверов PostgreSQL или, для
+# SQLite, пути к копиям базы. В тестах реплики подменяются основной базой.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME' if 'sqlite' in (DB_ENGINE or '') else 'HOST': replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['music_service.db.replicas.ReplicaRouter']
+    MIDDLEWARE.append('music_service.db.replicas.ReplicaMiddleware')
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
+# Кэши в памяти и в файлах сами вытесняют записи сверх MAX_ENTRIES; по
+# умолчанию их всего 300. Остальным бэкендам OPTIONS уходят в клиент.
+if CACHE_BACKEND.endswith(('LocMemCache', 'FileBasedCache')):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 50000)),
+    }
 
 # DATABASES = {
 #     'default': {
@@ -105,6 +158,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+RENDERER_CLASSES = ['rest_framework.renderers.JSONRenderer']
+PARSER_CLASSES = ['rest_framework.parsers.JSONParser']
+if find_spec('orjson'):
+    RENDERER_CLASSES = ['api.renderers.ORJSONRenderer']
+    PARSER_CLASSES = ['api.parsers.ORJSONParser']
+if find_spec('msgpack'):
+    RENDERER_CLASSES.append('api.renderers.MessagePackRenderer')
+    PARSER_CLASSES.append('api.parsers.MessagePackParser')
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -113,4 +175,51 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-}
\ No newline at end of file
+
+    'DEFAULT_RENDERER_CLASSES': [
+        *RENDERER_CLASSES,
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        *PARSER_CLASSES,
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+# Бюджеты запросов к базе на запрос по именам маршрутов ('api:tracks-list')
+# и 'default' для остальных: queries — всего запросов, duplicates — сколько
+# раз допустимо выполнить один и тот же запрос с разными параметрами.
+QUERY_BUDGETS = {
+    'default': {'queries': 40, 'duplicates': 10},
+}
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', '') == '1'
+QUERY_COUNT_HEADERS = DEBUG
+
+# Каталог, через который воркеры gunicorn складывают метрики для /metrics/.
+# Без него каждый процесс отдаёт только свои.
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+# Кому отдаётся /metrics/: адресам и сетям из METRICS_ALLOWED_IPS и
+# запросам с заголовком Authorization: Bearer <METRICS_TOKEN>.
+METRICS_ALLOWED_IPS = list(filter(None, os.getenv(
+    'METRICS_ALLOWED_IPS', '127.0.0.1,::1'
+).split(',')))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') or None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.queries': {
+            'handlers': ['console'],
+            # В лог попадают только выходы за бюджет; QUERY_LOG_LEVEL=INFO
+            # пишет итог каждого запроса.
+            'level': os.getenv('QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}